@@ -0,0 +1,113 @@
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import deletion
+from posts.models import Follow, Group, Post, User
+
+NUMBER_OF_TEST_POST = 13
+LIMIT = 10
+
+
+class ApiViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='the_group',
+            description='Test description'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text='Тестовый пост' + str(i),
+                author=cls.author,
+                group=cls.group,
+            )
+            for i in range(NUMBER_OF_TEST_POST)
+        ]
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ApiViewsTests.user)
+
+    def test_index_cursor_pagination(self):
+        """Курсор ведёт на следующую страницу без повторов."""
+        response = self.guest_client.get(reverse('api:index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        first = response.json()
+        self.assertEqual(len(first['results']), LIMIT)
+        second = self.guest_client.get(first['next']).json()
+        self.assertEqual(
+            len(second['results']), NUMBER_OF_TEST_POST - LIMIT
+        )
+        self.assertIsNone(second['next'])
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), NUMBER_OF_TEST_POST)
+
+    def test_sparse_fields(self):
+        """В ответе только запрошенные поля."""
+        response = self.guest_client.get(
+            reverse('api:group_list', kwargs={'slug': 'the_group'}),
+            {'fields': 'id,text'}
+        )
+        for post in response.json()['results']:
+            self.assertEqual(set(post), {'id', 'text'})
+        response = self.guest_client.get(
+            reverse('api:index'), {'fields': 'password'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_etag(self):
+        """Повторный запрос с If-None-Match получает 304."""
+        url = reverse('api:post_detail', kwargs={'post_id': self.posts[0].pk})
+        response = self.guest_client.get(url)
+        self.assertIn('ETag', response)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_profile_and_follow(self):
+        """Профиль и лента подписок отдают данные пользователя."""
+        response = self.authorized_client.get(
+            reverse('api:profile', kwargs={'username': 'author'})
+        )
+        self.assertTrue(response.json()['following'])
+        response = self.authorized_client.get(reverse('api:follow_index'))
+        self.assertEqual(len(response.json()['results']), LIMIT)
+        response = self.guest_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_not_found(self):
+        """Несуществующий пост возвращает JSON 404."""
+        response = self.guest_client.get(
+            reverse('api:post_detail', kwargs={'post_id': 1000})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertIn('detail', response.json())
+
+    def test_author_pending_deletion_hidden(self):
+        """Посты удаляемого автора не отдаёт ни один адрес API."""
+        self.guest_client.get(reverse('api:index'))
+        deletion.schedule_user(self.author)
+        response = self.guest_client.get(reverse('api:index'))
+        self.assertEqual(response.json()['results'], [])
+        response = self.guest_client.get(
+            reverse('api:group_list', kwargs={'slug': 'the_group'})
+        )
+        self.assertEqual(response.json()['results'], [])
+        response = self.authorized_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.json()['results'], [])
+        for url in (
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:post_detail', kwargs={'post_id': self.posts[0].pk}),
+        ):
+            response = self.guest_client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
@@ -0,0 +1,200 @@
+import base64
+import binascii
+import heapq
+import itertools
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.dateparse import parse_datetime
+from posts import sharding
+from posts.archive import ArchivedFeed
+from posts.models import is_detached
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+# Поле ответа -> колонки, которые нужно загрузить из БД.
+POST_FIELDS = {
+    'id': ('id',),
+    'text': ('text',),
+    'pub_date': ('pub_date',),
+    'author': (
+        'author', 'author__username',
+        'author__first_name', 'author__last_name',
+    ),
+    'group': ('group', 'group__slug', 'group__title'),
+    'image': ('image',),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, detail, status=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def parse_fields(request):
+    """Разбирает параметр ?fields=id,text в набор полей поста."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return tuple(POST_FIELDS)
+    fields = tuple(name for name in raw.split(',') if name)
+    unknown = set(fields) - set(POST_FIELDS)
+    if unknown:
+        raise ApiError(
+            f'Неизвестные поля: {", ".join(sorted(unknown))}.'
+        )
+    return fields
+
+
+def parse_limit(request):
+    raw = request.GET.get('limit')
+    if raw is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ApiError('Параметр limit должен быть числом.')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def only_fields(queryset, fields):
+    """Загружает из БД только колонки, нужные для запрошенных полей."""
+    columns = {'id', 'pub_date'}
+    for name in fields:
+        columns.update(POST_FIELDS[name])
+    related = [name for name in ('author', 'group') if name in fields]
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if is_detached(queryset.db):
+        # В шарде и архиве нет пользователей и групп, JOIN невозможен.
+        columns = {column for column in columns if '__' not in column}
+        return queryset.prefetch_related(*related).only(*columns)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def encode_cursor(post):
+    raw = f'{post.pub_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ApiError('Некорректный курсор.')
+    if pub_date is None:
+        raise ApiError('Некорректный курсор.')
+    return pub_date, pk
+
+
+def paginate(request, posts, fields, limit):
+    """Курсорная пагинация по (pub_date, id) от новых к старым.
+
+    posts — queryset или лента из нескольких (sharding.ShardedFeed,
+    archive.ArchivedFeed): страница берётся из каждой части и сливается.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor:
+        cursor = decode_cursor(cursor)
+
+    def first(queryset):
+        queryset = only_fields(queryset, fields).order_by('-pub_date', '-id')
+        if cursor:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        return list(queryset[:limit + 1])
+
+    if isinstance(posts, sharding.ShardedFeed):
+        pages = sharding.on_shards(
+            lambda alias: first(posts.queryset(alias))
+        )
+    elif isinstance(posts, ArchivedFeed):
+        pages = [first(queryset) for queryset in posts.querysets]
+    else:
+        pages = [first(posts)]
+    merged = heapq.merge(*pages, key=sharding.sort_key, reverse=True)
+    posts = list(itertools.islice(merged, limit + 1))
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1])
+    return posts, next_cursor
+
+
+def next_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(
+        f'{request.path}?{params.urlencode()}'
+    )
+
+
+def serialize_user(user):
+    return {
+        'username': user.username,
+        'full_name': user.get_full_name(),
+    }
+
+
+def serialize_group(group):
+    if group is None:
+        return None
+    return {
+        'slug': group.slug,
+        'title': group.title,
+    }
+
+
+def serialize_post(request, post, fields):
+    data = {}
+    for name in fields:
+        if name == 'author':
+            data[name] = serialize_user(post.author)
+        elif name == 'group':
+            data[name] = serialize_group(post.group)
+        elif name == 'image':
+            data[name] = (
+                request.build_absolute_uri(post.image.url)
+                if post.image else None
+            )
+        elif name == 'id':
+            data[name] = post.pk
+        else:
+            data[name] = getattr(post, name)
+    return data
+
+
+def serialize_page(request, posts, next_cursor, fields):
+    return {
+        'results': [serialize_post(request, post, fields) for post in posts],
+        'next': next_url(request, next_cursor),
+    }
+
+
+def dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def json_response(request, content, status=200):
+    """Отдаёт готовый JSON с ETag и ответом 304 на If-None-Match."""
+    response = JsonResponse({}, status=status)
+    response.content = content
+    if status != 200:
+        return response
+    set_response_etag(response)
+    return get_conditional_response(
+        request, etag=response['ETag'], response=response
+    )
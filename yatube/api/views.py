@@ -0,0 +1,124 @@
+from functools import wraps
+
+from core import caching
+from django.conf import settings
+from django.http import Http404
+from django.views.decorators.http import require_GET
+from posts import archive, feed, lookups, sharding
+from posts.models import DeletionJob, Group, User
+
+from .utils import (ApiError, dumps, json_response, only_fields, paginate,
+                    parse_fields, parse_limit, serialize_page, serialize_post,
+                    serialize_user)
+
+
+def api_view(view):
+    """Превращает ApiError и Http404 в JSON-ответы."""
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response(
+                request, dumps({'detail': error.detail}), error.status
+            )
+        except Http404:
+            return json_response(
+                request, dumps({'detail': 'Не найдено.'}), 404
+            )
+    return wrapper
+
+
+def cached_feed(request, key, generation, posts):
+    """Страница ленты, закешированная так же, как в HTML-версии.
+
+    generation — feed.version() областей, от которых зависит лента.
+    """
+    fields = parse_fields(request)
+    limit = parse_limit(request)
+    # С поколением лент: удаление и правки постов сбрасывают и API.
+    cache_key = 'api:{}:{}:{}:{}'.format(
+        generation, request.get_host(), key, request.GET.urlencode()
+    )
+
+    def render():
+        page, next_cursor = paginate(request, posts, fields, limit)
+        return dumps(serialize_page(request, page, next_cursor, fields))
+
+    return caching.get_or_set(
+        cache_key, render, settings.INDEX_CACHE_TIMEOUT
+    )
+
+
+@api_view
+def index(request):
+    content = cached_feed(
+        request, 'index', feed.version(('index',)), sharding.feed()
+    )
+    return json_response(request, content)
+
+
+@api_view
+def group_posts(request, slug):
+    group = lookups.get_or_404(Group, slug)
+    content = cached_feed(
+        request, f'group:{group.pk}', feed.version(('group', group.pk)),
+        sharding.feed(group_id=group.pk)
+    )
+    return json_response(request, content)
+
+
+@api_view
+def profile(request, username):
+    author = lookups.get_or_404(User, username)
+    hidden_authors, _ = DeletionJob.objects.hidden()
+    if author.pk in hidden_authors:
+        raise Http404('Пользователь удаляется.')
+    fields = parse_fields(request)
+    posts, next_cursor = paginate(
+        request, archive.posts_of(author), fields, parse_limit(request)
+    )
+    following = (request.user.is_authenticated
+                 and author.following.filter(user=request.user).exists())
+    data = serialize_page(request, posts, next_cursor, fields)
+    data['author'] = serialize_user(author)
+    data['following'] = following
+    return json_response(request, dumps(data))
+
+
+@api_view
+def post_detail(request, post_id):
+    fields = parse_fields(request)
+    post = only_fields(
+        sharding.post_queryset(post_id), fields
+    ).filter(pk=post_id).first() or archive.get_post(post_id)
+    hidden_authors, hidden_posts = DeletionJob.objects.hidden()
+    if (post is None or post.pk in hidden_posts
+            or post.author_id in hidden_authors):
+        raise Http404('Пост не найден.')
+    data = serialize_post(request, post, fields)
+    data['comments'] = [
+        {
+            'id': comment.pk,
+            'text': comment.text,
+            'created': comment.created,
+            'author': comment.author.username,
+        }
+        for comment in sharding.comments_of(post)
+    ]
+    return json_response(request, dumps(data))
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Требуется авторизация.', status=401)
+    fields = parse_fields(request)
+    posts, next_cursor = paginate(
+        request, sharding.followed_feed(request.user), fields,
+        parse_limit(request)
+    )
+    return json_response(
+        request, dumps(serialize_page(request, posts, next_cursor, fields))
+    )
@@ -3,3 +3,18 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+        from django.template.base import Template
+
+        from . import metrics, outbox, slow_queries, tracing
+        metrics.connect_signals()
+        metrics.clear_dead(settings.METRICS_DIR)
+        outbox.connect_signals()
+        connection_created.connect(slow_queries.install)
+        if settings.TRACING_SAMPLE_RATE > 0:
+            # У шаблонов нет хука на рендер include, поэтому, как и
+            # django.test.utils, подменяем Template._render.
+            Template._render = tracing.traced_render(Template._render)
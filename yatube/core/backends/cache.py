@@ -0,0 +1,37 @@
+from django.core.cache.backends import locmem
+
+from .. import caching, instrumentation, metrics, tracing
+
+_missing = object()
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания и промахи кеша для запроса и для метрик."""
+
+    def get(self, key, default=None, version=None):
+        with tracing.span('cache.get', **{'cache.key': key}) as span:
+            value = super().get(key, _missing, version)
+            if span is not None:
+                span['attributes']['cache.hit'] = value is not _missing
+        self.record(key, value is not _missing)
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        with tracing.span('cache.get_many', **{'cache.keys': len(keys)}):
+            values = super().get_many(keys, version)
+        for key in keys:
+            self.record(key, key in values)
+        return values
+
+    def clear(self):
+        super().clear()
+        # Локальный уровень core.caching тоже должен забыть старые значения.
+        caching.local.clear()
+
+    def record(self, key, hit):
+        instrumentation.record_cache(hit)
+        metrics.record_cache(key, hit)
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
@@ -0,0 +1,35 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+
+from .. import instrumentation
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        stats = instrumentation.current()
+        if stats is None:
+            return super().render(context, request)
+        # render_to_string внутри рендера не должен посчитаться дважды.
+        stats.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_depth -= 1
+            if not stats.render_depth:
+                stats.render_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    """Стандартный движок шаблонов с замером времени рендера."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
@@ -0,0 +1,36 @@
+import time
+
+from sorl.thumbnail import base
+
+from .. import instrumentation, metrics, tracing
+
+
+class ThumbnailBackend(base.ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который учитывает работу с превью."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        metrics.THUMBNAILS.labels('served').inc()
+        attributes = {'thumbnail.geometry': geometry_string}
+        with tracing.span('thumbnail', **attributes):
+            return self._get_thumbnail(file_, geometry_string, **options)
+
+    def _get_thumbnail(self, file_, geometry_string, **options):
+        stats = instrumentation.current()
+        if stats is None:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        started = time.perf_counter()
+        try:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        finally:
+            stats.thumbnails += 1
+            stats.thumbnail_time += time.perf_counter() - started
+
+    def _create_thumbnail(self, source_image, geometry_string, options,
+                          thumbnail):
+        super()._create_thumbnail(
+            source_image, geometry_string, options, thumbnail
+        )
+        metrics.THUMBNAILS.labels('created').inc()
+        stats = instrumentation.current()
+        if stats is not None:
+            stats.thumbnails_created += 1
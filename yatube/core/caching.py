@@ -0,0 +1,140 @@
+"""Двухуровневый кеш: LRU в памяти процесса поверх общего кеша.
+
+Локальный уровень живёт не дольше TIERED_CACHE_LOCAL_TIMEOUT, потому что
+сбросить его из другого процесса нельзя. В общем кеше значение хранится
+с «мягким» сроком: пока один процесс пересчитывает его под блокировкой
+cache.add(), остальные отдают устаревшую копию, а пересчёт может начаться
+чуть раньше срока (XFetch), чтобы ключ не истекал у всех сразу.
+"""
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import instrumentation
+from .metrics import TIERED_CACHE as REQUESTS
+
+LOCK_POLL_INTERVAL = 0.05
+XFETCH_BETA = 1.0
+
+
+class LocalCache:
+    """Потокобезопасный LRU с ограничением по числу ключей."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local = LocalCache(settings.TIERED_CACHE_LOCAL_SIZE)
+
+
+def should_refresh(expires, delta):
+    """XFetch: раньше срока с вероятностью, зависящей от цены пересчёта."""
+    return time.time() - delta * XFETCH_BETA * math.log(
+        random.random() or 1e-12
+    ) >= expires
+
+
+def compute_and_store(key, compute, timeout, stale_timeout):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    cache.set(
+        key, (value, time.time() + timeout, delta), timeout + stale_timeout
+    )
+    local.set(key, value, min(timeout, settings.TIERED_CACHE_LOCAL_TIMEOUT))
+    return value
+
+
+def get_or_set(key, compute, timeout, stale_timeout=None):
+    """Значение из кеша или результат compute(), посчитанный одним процессом.
+
+    Пока значение пересчитывается, остальные запросы в течение
+    stale_timeout секунд (по умолчанию — ещё timeout) получают старое.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    entry = local.get(key)
+    if entry is not None:
+        REQUESTS.labels('local', 'hit').inc()
+        instrumentation.record_cache(True)
+        return entry[0]
+
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, expires, delta = envelope
+        if not should_refresh(expires, delta):
+            REQUESTS.labels('shared', 'hit').inc()
+            local.set(
+                key, value,
+                min(expires - time.time(), settings.TIERED_CACHE_LOCAL_TIMEOUT)
+            )
+            return value
+
+    lock_key = f'{key}:lock'
+    lock_timeout = settings.TIERED_CACHE_LOCK_TIMEOUT
+    if cache.add(lock_key, 1, lock_timeout):
+        REQUESTS.labels(
+            'shared', 'miss' if envelope is None else 'refresh'
+        ).inc()
+        locked = time.monotonic()
+        try:
+            return compute_and_store(key, compute, timeout, stale_timeout)
+        finally:
+            # Если compute() шёл дольше lock_timeout, блокировка уже
+            # истекла и, возможно, взята другим процессом: её не трогаем.
+            if time.monotonic() - locked < lock_timeout:
+                cache.delete(lock_key)
+
+    if envelope is not None:
+        REQUESTS.labels('shared', 'stale').inc()
+        return envelope[0]
+
+    # Значения ещё нет, а считает его другой процесс: ждём результат.
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            REQUESTS.labels('shared', 'waited').inc()
+            return envelope[0]
+    REQUESTS.labels('shared', 'lock_timeout').inc()
+    return compute_and_store(key, compute, timeout, stale_timeout)
+
+
+def delete(key):
+    local.delete(key)
+    cache.delete(key)
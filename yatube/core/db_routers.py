@@ -0,0 +1,89 @@
+"""Чтение с реплик, запись в основную базу.
+
+Реплики перечислены в READ_REPLICAS; запрос читает из одной реплики,
+выбранной на весь запрос. После записи в рамках запроса и ещё
+REPLICA_STICKY_SECONDS после запроса, который что-то записал (по cookie),
+чтение идёт в основную базу, чтобы пользователь сразу видел свои
+изменения. Записью считается любая запись, прошедшая через роутеры
+(WriteTrackingRouter стоит в DATABASE_ROUTERS первым), и любая запись,
+отданная в core.writes.run.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+
+PRIMARY = 'default'
+_local = threading.local()
+
+
+def pin_primary(value=True):
+    _local.pinned = value
+
+
+def is_pinned():
+    return getattr(_local, 'pinned', False)
+
+
+def mark_written():
+    """Запрос что-то записал: дальше он читает из основной базы."""
+    _local.wrote = True
+    pin_primary()
+
+
+def begin_request(pinned=False):
+    _local.pinned = pinned
+    _local.wrote = False
+    _local.replica = None
+
+
+def end_request():
+    """Сбрасывает состояние запроса; True, если запрос что-то записал."""
+    wrote = getattr(_local, 'wrote', False)
+    begin_request()
+    return wrote
+
+
+def replica():
+    """Реплика текущего запроса: одна на все его чтения."""
+    chosen = getattr(_local, 'replica', None)
+    if chosen not in settings.READ_REPLICAS:
+        chosen = _local.replica = random.choice(settings.READ_REPLICAS)
+    return chosen
+
+
+def use_primary(view):
+    """Представление читает только из основной базы."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        pin_primary()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class WriteTrackingRouter:
+    """Отмечает запись и передаёт выбор базы следующим роутерам."""
+
+    def db_for_write(self, model, **hints):
+        mark_written()
+        return None
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if is_pinned() or not settings.READ_REPLICAS:
+            return PRIMARY
+        return replica()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.READ_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,42 @@
+"""Донат-кеширование фрагментов.
+
+Кешированный фрагмент общий для всех пользователей, а его персональные
+части ({% donut_hole %}) сохраняются метками и при каждом запросе
+рендерятся заново из живого контекста. Метку нельзя подделать текстом
+поста: автоэкранирование превращает «<» в «&lt;».
+"""
+import re
+
+HOLES = 'donut_holes'
+MARKER = '<!--donut:{}-->'
+MARKER_RE = re.compile(r'<!--donut:(\d+)-->')
+
+
+def render_shell(nodelist, context):
+    """Рендерит nodelist, заменяя дырки метками; возвращает (html, дырки)."""
+    holes = []
+    with context.push(**{HOLES: holes}):
+        html = nodelist.render(context)
+    return html, tuple(holes)
+
+
+def hole(context, template_name):
+    holes = context.get(HOLES)
+    if holes is None:
+        template = context.template.engine.get_template(template_name)
+        return template.render(context)
+    holes.append(template_name)
+    return MARKER.format(len(holes) - 1)
+
+
+def fill(shell, context):
+    """Подставляет в общий HTML персональные части текущего запроса.
+
+    Внутри другого кешируемого фрагмента дырки снова становятся метками.
+    """
+    html, holes = shell
+    if not holes:
+        return html
+    return MARKER_RE.sub(
+        lambda match: hole(context, holes[int(match[1])]), html
+    )
@@ -0,0 +1,61 @@
+import threading
+import time
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Счётчики работы, выполненной в рамках одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.thumbnails = 0
+        self.thumbnails_created = 0
+        self.thumbnail_time = 0.0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+
+def start():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def stop():
+    _local.stats = None
+
+
+def current():
+    """Счётчики текущего запроса или None, если он не попал в выборку."""
+    return getattr(_local, 'stats', None)
+
+
+def record_cache(hit):
+    stats = current()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+def set_view(name):
+    _local.view = name
+
+
+def current_view():
+    """Имя URL обрабатываемого запроса, если он уже сопоставлен с URL."""
+    return getattr(_local, 'view', None)
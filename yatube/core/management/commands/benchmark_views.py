@@ -0,0 +1,291 @@
+import json
+import logging
+import math
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from about import urls as about_urls
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import (setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+from django.urls import reverse
+from posts import urls as posts_urls
+from posts.models import Follow, Post, User
+from users import urls as users_urls
+
+URL_MODULES = (posts_urls, users_urls, about_urls)
+ROLES = ('anonymous', 'user')
+FOLLOWED_AUTHORS = 20
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(rank / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class QueryCounter:
+    """Запросы к БД из всех потоков процесса.
+
+    CaptureQueriesContext видит только соединение текущего потока, а поток
+    записи core.writes и пул шардов ходят в базу через свои. Обёртка
+    ставится на уже открытые соединения этого потока и на каждое новое.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        connection_created.connect(self.install)
+        for connection in connections.all():
+            self.install(connection=connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+@contextmanager
+def own_test_databases():
+    """Шарды и архив получают свои тестовые базы, а не зеркало default.
+
+    Реплики остаются зеркалами: это снимки основной базы.
+    """
+    aliases = {*settings.POST_SHARDS, settings.ARCHIVE_DATABASE} - {'default'}
+    mirrors = {}
+    for alias in aliases:
+        test = connections.databases[alias].setdefault('TEST', {})
+        mirrors[alias] = test.get('MIRROR')
+        test['MIRROR'] = None
+    try:
+        yield
+    finally:
+        for alias, mirror in mirrors.items():
+            connections.databases[alias]['TEST']['MIRROR'] = mirror
+
+
+def content_length(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95/p99, число запросов к БД и размер ответа '
+        'для всех страниц posts, users и about на синтетических данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=3000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.'
+        )
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument(
+            '--baseline',
+            help='JSON с эталонными результатами для сравнения.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно эталона (0.2 = 20%%).'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать результаты в файл --baseline.'
+        )
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs должен быть не меньше 1.')
+        if options['warmup'] < 0:
+            raise CommandError('--warmup не может быть отрицательным.')
+        setup_test_environment()
+        # Тестовые базы для всех алиасов: иначе шарды, реплики и архив
+        # читались бы из рабочих файлов.
+        with own_test_databases():
+            old_config = setup_databases(verbosity=0, interactive=False)
+        # Картинки generate_data и превью — тоже не в рабочий MEDIA_ROOT.
+        media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        try:
+            call_command(
+                'generate_data',
+                users=options['users'], posts=options['posts'],
+                comments=options['comments'], follows=options['follows'],
+                seed=options['seed'], verbosity=0,
+            )
+            results = self.run(options)
+        finally:
+            media.disable()
+            shutil.rmtree(media_root, ignore_errors=True)
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                key: options[key] for key in (
+                    'runs', 'users', 'posts', 'comments', 'follows',
+                    'seed', 'cold',
+                )
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write(self.format_table(results))
+
+        if options['baseline']:
+            if options['update_baseline']:
+                with open(options['baseline'], 'w') as output:
+                    json.dump(report, output, indent=2, sort_keys=True)
+                return
+            regressions = self.compare(
+                results, options['baseline'], options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессия производительности:\n' + '\n'.join(regressions)
+                )
+
+    def fixtures(self):
+        """Выбирает объекты, на которых будут открываться страницы."""
+        post = Post.objects.annotate(
+            comment_count=Count('comments')
+        ).order_by('-comment_count', '-pk').first()
+        viewer = post.author
+        authors = (
+            User.objects.exclude(pk=viewer.pk)
+            .annotate(follower_count=Count('following'))
+            .order_by('-follower_count', 'pk')[:FOLLOWED_AUTHORS]
+        )
+        Follow.objects.filter(user=viewer).delete()
+        Follow.objects.bulk_create(
+            Follow(user=viewer, author=author) for author in authors
+        )
+        group = post.group or Post.objects.exclude(group=None).first().group
+        return viewer, {
+            'slug': group.slug,
+            'username': authors[0].username,
+            'post_id': post.pk,
+        }
+
+    def urls(self, kwargs):
+        for module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                params = {
+                    key: kwargs[key] for key in pattern.pattern.converters
+                }
+                yield name, reverse(name, kwargs=params)
+
+    def run(self, options):
+        viewer, kwargs = self.fixtures()
+        # Ожидаемые 403/404 не должны засорять вывод трейсбеками.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        results = {}
+        with QueryCounter() as counter:
+            for role in ROLES:
+                client = Client()
+                for name, url in self.urls(kwargs):
+                    results[f'{name}|{role}'] = self.measure(
+                        client, url, role, viewer, counter, options
+                    )
+        return results
+
+    def measure(self, client, url, role, viewer, counter, options):
+        timings, queries, sizes, statuses = [], [], [], set()
+        for attempt in range(options['warmup'] + options['runs']):
+            if role == 'user':
+                # logout на предыдущем шаге сбрасывает сессию.
+                client.force_login(viewer)
+            if options['cold']:
+                cache.clear()
+            before = counter.count
+            started = time.perf_counter()
+            response = client.get(url)
+            size = content_length(response)
+            elapsed = time.perf_counter() - started
+            if attempt < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(counter.count - before)
+            sizes.append(size)
+            statuses.add(response.status_code)
+        result = {
+            f'p{rank}_ms': round(percentile(timings, rank), 3)
+            for rank in PERCENTILES
+        }
+        result.update(
+            url=url,
+            queries=max(queries),
+            bytes=max(sizes),
+            status=sorted(statuses),
+        )
+        return result
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as source:
+            baseline = json.load(source)['results']
+        regressions = []
+        for key, result in sorted(results.items()):
+            expected = baseline.get(key)
+            if expected is None:
+                continue
+            limit = expected['p95_ms'] * (1 + tolerance)
+            if result['p95_ms'] > limit:
+                regressions.append(
+                    f'{key}: p95 {result["p95_ms"]} мс > {limit:.3f} мс'
+                )
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f'{key}: запросов {result["queries"]} '
+                    f'> {expected["queries"]}'
+                )
+        return regressions
+
+    def format_table(self, results):
+        lines = [
+            f'{"view|role":<40} {"p50":>8} {"p95":>8} {"p99":>8} '
+            f'{"queries":>8} {"bytes":>8}'
+        ]
+        for key, result in sorted(results.items()):
+            lines.append(
+                f'{key:<40} {result["p50_ms"]:>8} {result["p95_ms"]:>8} '
+                f'{result["p99_ms"]:>8} {result["queries"]:>8} '
+                f'{result["bytes"]:>8}'
+            )
+        return '\n'.join(lines)
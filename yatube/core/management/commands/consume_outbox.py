@@ -0,0 +1,59 @@
+import time
+
+from core import outbox
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет потребителей журнала изменений core.outbox по новым '
+        'событиям всех баз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'consumers', nargs='*',
+            help='Имена потребителей, по умолчанию все.'
+        )
+        parser.add_argument(
+            '--follow', action='store_true',
+            help='Не выходить, а ждать новых событий.'
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Переиграть журнал с начала, чтобы пересобрать данные.'
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Удалить события, прочитанные всеми потребителями.'
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('consumers')
+        names = options['consumers'] or sorted(outbox.consumers)
+        unknown = set(names) - set(outbox.consumers)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные потребители: {", ".join(sorted(unknown))}'
+            )
+        if options['reset']:
+            for name in names:
+                outbox.reset(name)
+        while True:
+            total = 0
+            for database in outbox.databases():
+                for name in names:
+                    consumed = outbox.consume(name, database)
+                    total += consumed
+                    if consumed and options['verbosity'] > 1:
+                        self.stdout.write(
+                            f'{name}@{database}: событий {consumed}'
+                        )
+                if options['prune']:
+                    outbox.prune(database)
+            if not options['follow']:
+                break
+            if not total:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core import profiler
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдаёт токен для профилирования запроса: добавьте '
+        '?_profile=<токен> к адресу или передайте заголовок X-Profile.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiler.make_token())
@@ -0,0 +1,61 @@
+import multiprocessing
+
+from core import tasks
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди задач core.tasks: несколько процессов, в каждом '
+        'пул потоков. Потоки подходят задачам, которые ждут БД и диск, '
+        'процессы — тяжёлым по CPU, например созданию превью.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.TASK_POLL_INTERVAL,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда очередь опустеет.'
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        work_options = {
+            'threads': options['threads'],
+            'poll_interval': options['poll_interval'],
+            'burst': options['burst'],
+        }
+        if options['processes'] == 1:
+            try:
+                tasks.work(**work_options)
+            except KeyboardInterrupt:
+                pass
+            return
+        stop = multiprocessing.Event()
+        # Дочерние процессы не должны делить соединения родителя.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=tasks.work, kwargs={**work_options, 'stop': stop},
+                name=f'yatube-tasks-{number}',
+            )
+            for number in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
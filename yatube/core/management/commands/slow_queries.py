@@ -0,0 +1,62 @@
+import glob
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Сводка медленных запросов по суммарному времени.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.LOGS_DIR, 'slow_queries.jsonl'),
+            help='Журнал медленных запросов; ротированные копии '
+                 '(.1, .2, ...) читаются вместе с ним.'
+        )
+        parser.add_argument('--top', type=int, default=10)
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(options['path'] + '*'))
+        if not paths:
+            raise CommandError(f'Журнал {options["path"]} не найден.')
+        queries = defaultdict(lambda: {
+            'count': 0, 'total': 0.0, 'max': 0.0,
+            'views': Counter(), 'plan': None,
+        })
+        for path in paths:
+            with open(path, encoding='utf-8') as source:
+                for line in source:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    query = queries[record['sql']]
+                    query['count'] += 1
+                    query['total'] += record['duration_ms']
+                    if record['duration_ms'] >= query['max']:
+                        query['max'] = record['duration_ms']
+                        query['plan'] = record.get('plan')
+                    query['views'][record.get('view') or '-'] += 1
+
+        top = sorted(
+            queries.items(), key=lambda item: item[1]['total'], reverse=True
+        )[:options['top']]
+        for number, (sql, query) in enumerate(top, 1):
+            views = ', '.join(
+                f'{view} ({count})'
+                for view, count in query['views'].most_common(3)
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{number}. всего {query["total"]:.1f} мс, '
+                f'{query["count"]} раз, '
+                f'среднее {query["total"] / query["count"]:.1f} мс, '
+                f'максимум {query["max"]:.1f} мс'
+            ))
+            self.stdout.write(f'   представления: {views}')
+            self.stdout.write(f'   {sql}')
+            for row in query['plan'] or ():
+                self.stdout.write(f'     {row}')
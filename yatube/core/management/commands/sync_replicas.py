@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import time
+
+from core.signals import replicas_synced
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def remove_wal_files(path):
+    for suffix in ('-wal', '-shm'):
+        try:
+            os.remove(f'{path}{suffix}')
+        except FileNotFoundError:
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет SQLite-реплики из READ_REPLICAS снимком основной базы. '
+        'Основная база переводится в режим WAL, чтобы снимок не мешал '
+        'записи; снимок переводится обратно в режим DELETE и атомарно '
+        'подменяет реплику.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд; 0 — один раз.'
+        )
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError(
+                'Для этой СУБД реплики обновляет её собственная репликация.'
+            )
+        primary = settings.DATABASES['default']['NAME']
+        with sqlite3.connect(primary) as source:
+            source.execute('PRAGMA journal_mode=WAL')
+        while True:
+            started = time.monotonic()
+            for alias in settings.READ_REPLICAS:
+                target = settings.DATABASES[alias]['NAME']
+                snapshot = f'{target}.snapshot'
+                source = sqlite3.connect(primary)
+                destination = sqlite3.connect(snapshot)
+                try:
+                    source.backup(destination)
+                    # Снимок наследует режим WAL основной базы. Читатели
+                    # реплики открыли бы её -wal и -shm, а они остаются от
+                    # прежнего файла: новый снимок без журнала WAL.
+                    destination.execute('PRAGMA journal_mode=DELETE')
+                finally:
+                    destination.close()
+                    source.close()
+                remove_wal_files(snapshot)
+                remove_wal_files(target)
+                # Открытые соединения дочитают старый файл, новые
+                # откроют свежий снимок.
+                os.replace(snapshot, target)
+            replicas_synced.send(sender=self.__class__)
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'Реплик обновлено: {len(settings.READ_REPLICAS)} за '
+                    f'{time.monotonic() - started:.2f} с.'
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,125 @@
+"""Метрики в формате Prometheus.
+
+В многопроцессном режиме (переменная PROMETHEUS_MULTIPROC_DIR, её
+выставляют настройки) каждый воркер пишет значения в свой mmap-файл, а
+представление /metrics суммирует файлы всех процессов. Файлы прошлого
+запуска удаляет clear_dir() при старте мастера, а файлы остановленного
+воркера помечает mark_process_dead(pid); оба вызова делают хуки
+gunicorn.conf.py. Без gunicorn (runserver, manage.py, другой сервер)
+файлы завершившихся процессов удаляет clear_dead() при старте
+приложения.
+"""
+import glob
+import os
+
+from django.db.models.signals import post_delete, post_save
+from prometheus_client import (CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.registry import REGISTRY
+
+FRAGMENT_PREFIX = 'template.cache.'
+TRACKED_MODELS = ('posts.Post', 'posts.Comment', 'posts.Follow')
+
+REQUEST_LATENCY = Histogram(
+    'yatube_request_latency_seconds',
+    'Время ответа по имени URL.',
+    ['view'],
+)
+REQUEST_QUERIES = Histogram(
+    'yatube_request_queries',
+    'Число SQL-запросов на ответ.',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf')),
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests',
+    'Обращения к кешу: фрагменты {% cache %} и прочие ключи.',
+    ['cache', 'result'],
+)
+TIERED_CACHE = Counter(
+    'yatube_tiered_cache',
+    'Обращения к двухуровневому кешу по уровням и результатам.',
+    ['tier', 'result'],
+)
+THUMBNAILS = Counter(
+    'yatube_thumbnails',
+    'Вызовы {% thumbnail %} и реально созданные превью.',
+    ['result'],
+)
+WRITES = Counter(
+    'yatube_writes',
+    'Запись постов, комментариев и подписок.',
+    ['model', 'action'],
+)
+WRITE_BATCHES = Histogram(
+    'yatube_write_batch_size',
+    'Число записей в одном групповом коммите core.writes.',
+    buckets=(1, 2, 4, 8, 16, 32, 64, float('inf')),
+)
+TASKS = Counter(
+    'yatube_tasks',
+    'Выполненные задачи очереди core.tasks по результатам.',
+    ['task', 'result'],
+)
+
+
+def record_cache(key, hit):
+    cache_name = 'fragment' if key.startswith(FRAGMENT_PREFIX) else 'default'
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def record_write(sender, created=None, **kwargs):
+    if created is None:
+        action = 'delete'
+    else:
+        action = 'create' if created else 'update'
+    WRITES.labels(sender._meta.model_name, action).inc()
+
+
+def connect_signals():
+    for model in TRACKED_MODELS:
+        post_save.connect(record_write, sender=model)
+        post_delete.connect(record_write, sender=model)
+
+
+def clear_dir(path):
+    """Удаляет mmap-файлы прошлых запусков, пока воркеры не стартовали."""
+    for name in glob.glob(os.path.join(path, '*.db')):
+        os.remove(name)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_dead(path):
+    """Удаляет mmap-файлы процессов, которых уже нет."""
+    for name in glob.glob(os.path.join(path, '*_*.db')):
+        pid = os.path.splitext(os.path.basename(name))[0].rsplit('_', 1)[1]
+        if pid.isdigit() and not is_alive(int(pid)):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                # Удалил параллельно стартовавший процесс.
+                pass
+
+
+def mark_process_dead(pid):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def render():
+    """Текст для /metrics, собранный по всем процессам."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
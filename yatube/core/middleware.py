@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from . import (db_routers, instrumentation, metrics, profiler, tracing,
+               views, writes)
+
+logger = logging.getLogger('yatube.requests')
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+class RequestStatsMiddleware:
+    """Замеряет SQL, рендер, кеш и превью для доли запросов.
+
+    Итог отдаётся в заголовке Server-Timing и пишется одной строкой JSON
+    в логгер yatube.requests. Доля задаётся REQUEST_STATS_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.handle(request)
+        finally:
+            instrumentation.set_view(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        instrumentation.set_view(url_name(request))
+
+    def handle(self, request):
+        rate = settings.REQUEST_STATS_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        stats = instrumentation.start()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            instrumentation.stop()
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{stats.queries} queries"',
+            f'tpl;dur={stats.render_time * 1000:.1f}',
+            f'cache;desc="hit={stats.cache_hits} miss={stats.cache_misses}"',
+            f'thumb;dur={stats.thumbnail_time * 1000:.1f};'
+            f'desc="{stats.thumbnails} calls, '
+            f'{stats.thumbnails_created} created"',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        logger.info(json.dumps({
+            'url_name': url_name(request),
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_time * 1000, 2),
+            'render_ms': round(stats.render_time * 1000, 2),
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+            'thumbnails': stats.thumbnails,
+            'thumbnails_created': stats.thumbnails_created,
+            'thumbnail_ms': round(stats.thumbnail_time * 1000, 2),
+        }))
+        return response
+
+
+class QueryCounter:
+    """Обёртка для connection.execute_wrapper, которая только считает."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Гистограммы времени ответа и числа SQL-запросов для /metrics.
+
+    Запросы к БД считаются у каждого ответа, а не только у выборки
+    RequestStatsMiddleware; записи потока core.writes не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        view = url_name(request) or 'unresolved'
+        metrics.REQUEST_LATENCY.labels(view).observe(
+            time.perf_counter() - started
+        )
+        metrics.REQUEST_QUERIES.labels(view).observe(counter.queries)
+        return response
+
+
+class ProfilerMiddleware:
+    """Семплирующий профайлер для отдельного запроса.
+
+    Включается подписанным токеном в параметре ?_profile= или заголовке
+    X-Profile (токен выдаёт команда profile_token). Без токена стоит одну
+    проверку словаря.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = (request.GET.get(profiler.PARAM)
+                 or request.META.get(profiler.HEADER))
+        if not token or not profiler.check_token(token):
+            return self.get_response(request)
+
+        sampler = profiler.SamplingProfiler(
+            threading.get_ident(), settings.PROFILER_INTERVAL
+        )
+        sampler.start()
+        try:
+            response = self.get_response(request)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        finally:
+            sampler.stop()
+        path = profiler.profile_path(url_name(request))
+        sampler.write(path)
+        response['X-Profile-File'] = os.path.basename(path)
+        return response
+
+
+class TracingMiddleware:
+    """Трассировка доли запросов вложенными span'ами.
+
+    Разбор URL, представление, SQL-запросы, шаблоны (включая include),
+    превью и обращения к кешу. Трассы пишутся в логгер yatube.traces.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.TRACING_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        trace = tracing.start()
+        try:
+            with tracing.span(
+                f'{request.method} {request.path}', tracing.KIND_SERVER,
+                **{'http.method': request.method,
+                   'http.target': request.get_full_path()}
+            ) as root:
+                with tracing.span('url.resolve'):
+                    try:
+                        match = resolve(request.path_info)
+                    except Resolver404:
+                        match = None
+                root['attributes']['http.route'] = (
+                    match.view_name if match else None
+                )
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(
+                            connection.execute_wrapper(tracing.query_wrapper)
+                        )
+                    response = self.get_response(request)
+                view_span = getattr(request, '_trace_view_span', None)
+                if view_span is not None:
+                    trace.close(view_span)
+                root['attributes']['http.status_code'] = response.status_code
+        finally:
+            tracing.stop()
+        tracing.export(trace)
+        response['traceparent'] = f'00-{trace.trace_id}-{root["spanId"]}-01'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = tracing.current()
+        if trace is not None:
+            request._trace_view_span = trace.open(
+                'view', tracing.KIND_INTERNAL,
+                {'code.function': getattr(view_func, '__qualname__', None),
+                 'code.namespace': getattr(view_func, '__module__', None)}
+            )
+
+
+class ReplicaMiddleware:
+    """Прилипание к основной базе после запросов, которые что-то записали.
+
+    Запись определяется не по методу: подписка, например, — это GET.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        db_routers.begin_request(
+            unsafe or settings.REPLICA_STICKY_COOKIE in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = db_routers.end_request()
+        if wrote and settings.READ_REPLICAS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+            )
+        return response
+
+
+class WriteTimeoutMiddleware:
+    """Не дождавшаяся очереди запись — 503, а не ошибка сервера."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, writes.WriteTimeout):
+            return views.service_unavailable(request, exception)
+        return None
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumerOffset',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=100)),
+                ('database', models.CharField(default='default', max_length=100)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Создание'), ('update', 'Изменение'), ('delete', 'Удаление')], max_length=6)),
+                ('payload', models.TextField(default='{}')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='consumeroffset',
+            constraint=models.UniqueConstraint(fields=('consumer', 'database'), name='unique_consumer_offset'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """Отложенная задача очереди core.tasks."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    ACTIVE = (QUEUED, RUNNING)
+
+    name = models.CharField(max_length=200)
+    arguments = models.TextField(default='[[], {}]')
+    key = models.CharField(
+        'Ключ дедупликации', max_length=200, null=True, blank=True
+    )
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    status = models.CharField(
+        max_length=7,
+        choices=[(QUEUED, 'В очереди'), (RUNNING, 'Выполняется'),
+                 (FAILED, 'Ошибка')],
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+            models.Index(fields=['locked_by']),
+        ]
+        constraints = [
+            # Одна невыполненная задача на ключ; выполненные удаляются.
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=Q(status__in=('queued', 'running')),
+                name='unique_active_task_key',
+            ),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """Изменение модели, записанное в той же транзакции (core.outbox)."""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    model = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(
+        max_length=6,
+        choices=[(CREATE, 'Создание'), (UPDATE, 'Изменение'),
+                 (DELETE, 'Удаление')],
+    )
+    payload = models.TextField(default='{}')
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.action} {self.model} {self.object_id}'
+
+
+class ConsumerOffset(models.Model):
+    """Последнее обработанное потребителем событие в базе database."""
+    consumer = models.CharField(max_length=100)
+    database = models.CharField(max_length=100, default='default')
+    position = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.consumer}@{self.database}: {self.position}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['consumer', 'database'], name='unique_consumer_offset'
+            ),
+        ]
@@ -0,0 +1,168 @@
+"""Журнал изменений (transactional outbox).
+
+Каждое сохранение и удаление постов, комментариев, подписок и групп
+пишет строку OutboxEvent в ту же базу и ту же транзакцию, что и само
+изменение: откат убирает и событие, а закоммиченное изменение всегда
+попадает в журнал. Производные данные (кеши, поисковый индекс, счётчики)
+обновляют потребители — функции, зарегистрированные @consumer в модулях
+consumers.py приложений. Их выполняет команда consume_outbox вне
+запросов.
+
+Доставка «хотя бы один раз»: позиция потребителя (ConsumerOffset)
+сдвигается только после того, как обработана вся пачка событий, так что
+после сбоя пачка придёт снова. Сброс позиции в ноль переигрывает журнал
+и пересобирает производные данные с нуля.
+
+id событий растут в порядке коммитов, пока запись в базу идёт в один
+поток, как в SQLite. Массовые операции без сигналов (bulk_create,
+update, пакетные удаления posts.deletion) в журнал не попадают, если не
+записать их через record_many() или record_queryset().
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import ConsumerOffset, OutboxEvent
+
+TRACKED_MODELS = ('posts.Post', 'posts.Comment', 'posts.Follow',
+                  'posts.Group')
+
+consumers = {}
+
+
+def consumer(name):
+    """Регистрирует обработчик пачки событий handler(events)."""
+    def decorator(handler):
+        consumers[name] = handler
+        return handler
+    return decorator
+
+
+def payload(instance):
+    values = {}
+    for field in instance._meta.concrete_fields:
+        value = field.value_from_object(instance)
+        values[field.attname] = (
+            None if value is None else field.value_to_string(instance)
+        )
+    return json.dumps(values)
+
+
+def record(sender, instance, using, created=None, **kwargs):
+    if created is None:
+        action = OutboxEvent.DELETE
+    else:
+        action = OutboxEvent.CREATE if created else OutboxEvent.UPDATE
+    OutboxEvent.objects.using(using).create(
+        model=sender._meta.label_lower,
+        object_id=instance.pk,
+        action=action,
+        payload=payload(instance),
+    )
+
+
+def record_many(model, ids, action, using='default', payloads=None):
+    """События для изменений в обход сигналов; вызывать в той же
+    транзакции. payloads — необязательные поля событий по id."""
+    payloads = payloads or {}
+    OutboxEvent.objects.using(using).bulk_create([
+        OutboxEvent(model=model._meta.label_lower, object_id=pk,
+                    action=action, payload=json.dumps(payloads.get(pk, {})))
+        for pk in ids
+    ])
+
+
+def record_queryset(queryset, action):
+    """Как record_many, но одним INSERT ... SELECT, без выборки id.
+
+    Вызывать в транзакции до UPDATE или DELETE над queryset."""
+    connection = connections[queryset.db]
+    sql, params = queryset.values('pk').query.sql_with_params()
+    table = connection.ops.quote_name(OutboxEvent._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (model, object_id, action, payload, '
+            f'created) SELECT %s, id, %s, %s, %s FROM ({sql}) selected',
+            [queryset.model._meta.label_lower, action, '{}',
+             connection.ops.adapt_datetimefield_value(timezone.now()),
+             *params],
+        )
+
+
+def connect_signals():
+    for model in TRACKED_MODELS:
+        post_save.connect(record, sender=model)
+        post_delete.connect(record, sender=model)
+
+
+def databases():
+    """Базы с журналом: основная и шарды постов."""
+    return list(dict.fromkeys(['default', *settings.POST_SHARDS]))
+
+
+def position(name, database='default'):
+    offset = ConsumerOffset.objects.filter(
+        consumer=name, database=database
+    ).first()
+    return offset.position if offset else 0
+
+
+def commit(name, database, value):
+    ConsumerOffset.objects.update_or_create(
+        consumer=name, database=database, defaults={'position': value}
+    )
+
+
+def reset(name):
+    """Следующий проход переиграет журнал с начала."""
+    ConsumerOffset.objects.filter(consumer=name).update(position=0)
+
+
+def read(name, database='default', limit=None):
+    """Следующая пачка событий после позиции потребителя."""
+    return list(OutboxEvent.objects.using(database).filter(
+        pk__gt=position(name, database)
+    ).order_by('pk')[:limit or settings.OUTBOX_BATCH_SIZE])
+
+
+def stream(name, database='default', follow=False, poll_interval=None):
+    """События по порядку; позиция сдвигается после каждой пачки."""
+    poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+    while True:
+        events = read(name, database)
+        if not events:
+            if not follow:
+                return
+            time.sleep(poll_interval)
+            continue
+        yield from events
+        commit(name, database, events[-1].pk)
+
+
+def consume(name, database='default'):
+    """Один проход потребителя name по журналу; число событий."""
+    handler = consumers[name]
+    total = 0
+    while True:
+        events = read(name, database)
+        if not events:
+            return total
+        with transaction.atomic():
+            handler(events)
+            commit(name, database, events[-1].pk)
+        total += len(events)
+
+
+def prune(database='default'):
+    """Удаляет события, которые уже прочитали все потребители."""
+    if not consumers:
+        return 0
+    oldest = min(position(name, database) for name in consumers)
+    deleted, _ = OutboxEvent.objects.using(database).filter(
+        pk__lte=oldest
+    ).delete()
+    return deleted
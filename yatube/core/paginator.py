@@ -0,0 +1,68 @@
+"""Paginator с приблизительным числом объектов.
+
+Обычный Paginator делает точный COUNT(*) на каждой странице ленты и
+списка в админке, хотя для ссылок на страницы хватает оценки. Здесь
+число берётся из кеша: его пересчитывает первый запрос после истечения
+ESTIMATED_COUNT_TIMEOUT, а между пересчётами сдвигают счётчики adjust()
+(потребитель журнала изменений posts.consumers). Пока объектов меньше
+ESTIMATED_COUNT_THRESHOLD, число считается точно на каждом запросе:
+такой COUNT дешёвый, а ошибка в оценке была бы заметна.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+def cache_key(name):
+    return f'count:{name}'
+
+
+def adjust(name, delta):
+    """Сдвигает закешированное число объектов, если оно есть."""
+    try:
+        cache.incr(cache_key(name), delta)
+    except ValueError:
+        pass
+
+
+class EstimatedCountPaginator(Paginator):
+    """Подменяет Paginator без изменений в шаблонах.
+
+    count_key — имя счётчика для adjust(); без него ключом служит хеш
+    SQL-запроса, как в списках админки.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, count_key=None):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.count_key = count_key
+
+    def key(self):
+        if self.count_key is not None:
+            return cache_key(self.count_key)
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return None
+        try:
+            sql = f'{self.object_list.db}:{query}'
+        except EmptyResultSet:
+            return None
+        return cache_key(hashlib.md5(sql.encode()).hexdigest())
+
+    @cached_property
+    def count(self):
+        key = self.key()
+        estimate = cache.get(key) if key else None
+        if estimate is not None and (
+            estimate >= settings.ESTIMATED_COUNT_THRESHOLD
+        ):
+            return estimate
+        exact = Paginator.count.func(self)
+        if key and exact != estimate:
+            cache.set(key, exact, settings.ESTIMATED_COUNT_TIMEOUT)
+        return exact
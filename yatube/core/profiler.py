@@ -0,0 +1,79 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'yatube.profiler'
+PARAM = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILER_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', code.co_filename)
+    return f'{module}:{code.co_name}'
+
+
+class SamplingProfiler:
+    """Снимает стек одного потока с заданным интервалом.
+
+    Результат пишется в формате collapsed stacks (стек через «;» и число
+    сэмплов), который понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.samples.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+def profile_path(name):
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    filename = '{}-{}-{}.collapsed'.format(
+        (name or 'unresolved').replace(':', '.'),
+        int(time.time() * 1000),
+        os.getpid(),
+    )
+    return os.path.join(settings.PROFILER_DIR, filename)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Реплики обновлены свежим снимком основной базы.
+replicas_synced = Signal()
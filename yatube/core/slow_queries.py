@@ -0,0 +1,92 @@
+import datetime as dt
+import decimal
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from . import instrumentation
+
+logger = logging.getLogger('yatube.slow_queries')
+_local = threading.local()
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+SAFE_TYPES = (decimal.Decimal, dt.date, dt.time, uuid.UUID)
+
+
+def normalize(sql):
+    """Схлопывает IN (%s, %s, ...) разной длины в один шаблон."""
+    return IN_LIST.sub('(%s, ...)', sql)
+
+
+def redact(params):
+    """Оставляет числа и даты, строки заменяет на их длину."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact_value(value) for key, value in params.items()}
+    return [redact_value(value) for value in params]
+
+
+def redact_value(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, SAFE_TYPES):
+        return str(value)
+    if isinstance(value, (str, bytes, memoryview)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def explain(connection, sql, params):
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor in ('postgresql', 'mysql'):
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    _local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(map(str, row)) for row in cursor.fetchall()]
+    except Exception as error:
+        return [f'EXPLAIN failed: {error}']
+    finally:
+        _local.explaining = False
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    """Пишет в лог запросы дольше SLOW_QUERY_THRESHOLD_MS вместе с планом."""
+    if getattr(_local, 'explaining', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if threshold and duration >= threshold:
+            connection = context['connection']
+            plan = None
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                plan = explain(connection, sql, params)
+            logger.warning(json.dumps({
+                'time': dt.datetime.now(dt.timezone.utc).isoformat(),
+                'duration_ms': round(duration, 2),
+                'database': connection.alias,
+                'view': instrumentation.current_view(),
+                'sql': normalize(sql),
+                'params': None if many else redact(params),
+                'plan': plan,
+            }, ensure_ascii=False))
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: подключает обёртку к соединению."""
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_wrapper)
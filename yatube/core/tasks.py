@@ -0,0 +1,233 @@
+"""Очередь фоновых задач в основной базе данных.
+
+Задача — строка core.Task с именем функции и JSON-аргументами, поэтому
+она ставится в очередь в той же транзакции, что и изменение, которое её
+породило, и не теряется при перезапуске. Брокер не нужен: воркеры
+(команда run_tasks) забирают готовые задачи условным UPDATE, так что
+одну задачу не выполнят дважды, а задачи упавшего воркера возвращаются
+в очередь, когда истекает их аренда TASK_LEASE_SECONDS. Долгие задачи
+продлевают аренду через heartbeat(). Ошибка откладывает повтор с
+экспоненциальной задержкой до max_attempts попыток; истёкшая аренда
+тоже считается попыткой, так что задача, которая роняет воркер, в итоге
+падает, а не забирается снова бесконечно.
+
+Функции задач объявляются декоратором @task в модулях tasks.py
+приложений.
+"""
+import datetime as dt
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+_current = threading.local()
+
+
+class LeaseLost(Exception):
+    """Аренду задачи забрал другой воркер: выполнение надо прервать."""
+
+
+def task(func=None, *, priority=0, max_attempts=3):
+    """Регистрирует функцию как задачу: func.enqueue(...) ставит её
+    в очередь."""
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        registry[name] = func
+        func.task_name = name
+        func.priority = priority
+        func.max_attempts = max_attempts
+        func.enqueue = lambda *args, **kwargs: enqueue(func, args, **kwargs)
+        return func
+    return decorator(func) if func else decorator
+
+
+def enqueue(func, args=(), kwargs=None, key=None, delay=0, priority=None):
+    """Ставит задачу в очередь; с ключом key — только если такой ещё нет.
+
+    Возвращает задачу, новую или уже стоящую в очереди с тем же ключом.
+    """
+    values = {
+        'name': func.task_name,
+        'arguments': json.dumps([list(args), kwargs or {}]),
+        'priority': func.priority if priority is None else priority,
+        'max_attempts': func.max_attempts,
+        'run_at': timezone.now() + dt.timedelta(seconds=delay),
+    }
+    if key is None:
+        return Task.objects.create(**values)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(key=key, **values)
+    except IntegrityError:
+        existing = Task.objects.filter(
+            key=key, status__in=Task.ACTIVE
+        ).first()
+        if existing is None:
+            # Задачу с этим ключом только что выполнили: ставим заново.
+            return Task.objects.create(key=key, **values)
+        return existing
+
+
+def lease_end():
+    return timezone.now() + dt.timedelta(
+        seconds=settings.TASK_LEASE_SECONDS
+    )
+
+
+def ready():
+    now = timezone.now()
+    return Task.objects.filter(
+        Q(status=Task.QUEUED, run_at__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now,
+            attempts__lt=F('max_attempts'))
+    )
+
+
+def expire():
+    """Задачи с истёкшей арендой и без оставшихся попыток — в FAILED."""
+    Task.objects.filter(
+        status=Task.RUNNING, locked_until__lt=timezone.now(),
+        attempts__gte=F('max_attempts'),
+    ).update(status=Task.FAILED, error='Истекла аренда последней попытки')
+
+
+def claim(worker, limit, key=None):
+    """Забирает до limit готовых задач, самые приоритетные первыми.
+
+    key — забрать только задачу с этим ключом дедупликации.
+    """
+    expire()
+    candidates = ready()
+    if key is not None:
+        candidates = candidates.filter(key=key)
+    ids = list(candidates.order_by('-priority', 'run_at', 'id').values_list(
+        'id', flat=True
+    )[:limit])
+    if not ids:
+        return []
+    token = f'{worker}:{uuid.uuid4().hex}'
+    # Условие ready() повторяется в UPDATE: задачи, которые успел забрать
+    # другой воркер, не перезаписываются.
+    ready().filter(id__in=ids).update(
+        status=Task.RUNNING,
+        locked_by=token,
+        locked_until=lease_end(),
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(locked_by=token).order_by(
+        '-priority', 'run_at', 'id'
+    ))
+
+
+def heartbeat():
+    """Продлевает аренду задачи, которую выполняет текущий поток.
+
+    Вне задачи ничего не делает. Если аренду уже забрал другой воркер,
+    бросает LeaseLost: продолжать значит выполнять задачу дважды.
+    """
+    task = getattr(_current, 'task', None)
+    if task is None:
+        return
+    renewed = Task.objects.filter(
+        pk=task.pk, locked_by=task.locked_by
+    ).update(locked_until=lease_end())
+    if not renewed:
+        raise LeaseLost(f'Аренду задачи {task} забрал другой воркер')
+
+
+def call(task):
+    func = registry.get(task.name)
+    if func is None:
+        raise LookupError(f'Неизвестная задача {task.name}')
+    args, kwargs = json.loads(task.arguments)
+    func(*args, **kwargs)
+
+
+def execute(task, run=call):
+    """Выполняет забранную задачу; run(task) заменяет вызов её функции."""
+    ours = Task.objects.filter(pk=task.pk, locked_by=task.locked_by)
+    _current.task = task
+    try:
+        run(task)
+    except LeaseLost:
+        logger.warning('Задача %s потеряла аренду и прервана', task)
+        result = 'lost'
+    except Exception as error:
+        logger.exception('Задача %s завершилась ошибкой', task)
+        if task.attempts < task.max_attempts:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (task.attempts - 1)
+            ours.update(
+                status=Task.QUEUED,
+                run_at=timezone.now() + dt.timedelta(seconds=delay),
+                locked_by='',
+                error=repr(error),
+            )
+            result = 'retry'
+        else:
+            ours.update(status=Task.FAILED, error=repr(error))
+            result = 'failed'
+    else:
+        ours.delete()
+        result = 'done'
+    finally:
+        _current.task = None
+    metrics.TASKS.labels(task.name, result).inc()
+    return result
+
+
+def execute_in_thread(task):
+    try:
+        return execute(task)
+    finally:
+        close_old_connections()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(threads=1, poll_interval=None, burst=False, stop=None):
+    """Цикл воркера: забирает задачи пачками по числу потоков.
+
+    burst — выйти, когда очередь опустеет; stop — threading.Event или
+    multiprocessing.Event для остановки.
+    """
+    poll_interval = poll_interval or settings.TASK_POLL_INTERVAL
+    worker = worker_name()
+    pool = ThreadPoolExecutor(threads) if threads > 1 else None
+    try:
+        while stop is None or not stop.is_set():
+            batch = claim(worker, threads)
+            if not batch:
+                if burst:
+                    return
+                close_old_connections()
+                if stop is None:
+                    time.sleep(poll_interval)
+                else:
+                    stop.wait(poll_interval)
+                continue
+            if pool is None:
+                for task in batch:
+                    execute(task)
+            else:
+                list(pool.map(execute_in_thread, batch))
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,78 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+from django.template.base import TemplateSyntaxError
+
+from .. import caching, donut
+
+register = template.Library()
+
+
+class TieredCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        try:
+            timeout = int(timeout)
+        except (TypeError, ValueError):
+            raise TemplateSyntaxError(
+                f'"tiered_cache": некорректный срок "{timeout}"'
+            )
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on],
+        )
+        shell = caching.get_or_set(
+            key, lambda: donut.render_shell(self.nodelist, context), timeout
+        )
+        return donut.fill(shell, context)
+
+
+@register.tag
+def tiered_cache(parser, token):
+    """Как {% cache %}, но через двухуровневый кеш core.caching.
+
+    {% tiered_cache 20 index_page page_obj.number %} ... {% endtiered_cache %}
+
+    Вложенные {% donut_hole %} рендерятся заново при каждом запросе.
+    """
+    nodelist = parser.parse(('endtiered_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise TemplateSyntaxError(
+            f'"{bits[0]}" принимает минимум два аргумента.'
+        )
+    return TieredCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
+
+
+class DonutHoleNode(template.Node):
+    def __init__(self, template_name):
+        self.template_name = template_name
+
+    def render(self, context):
+        return donut.hole(context, self.template_name.resolve(context))
+
+
+@register.tag
+def donut_hole(parser, token):
+    """Персональная часть кешируемого фрагмента.
+
+    {% donut_hole 'posts/includes/follow_button.html' %} работает как
+    {% include %}, но внутри {% tiered_cache %} не попадает в общий кеш.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise TemplateSyntaxError(
+            f'"{bits[0]}" принимает один аргумент — имя шаблона.'
+        )
+    return DonutHoleNode(parser.compile_filter(bits[1]))
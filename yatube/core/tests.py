@@ -0,0 +1,710 @@
+import datetime as dt
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from io import StringIO
+from unittest import mock
+
+from core import (caching, db_routers, metrics, outbox, paginator, profiler,
+                  tasks, writes)
+from core.management.commands import benchmark_views
+from core.models import OutboxEvent, Task
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, router, transaction
+from django.template import Context, Engine
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from posts.models import Follow, Post, User
+from prometheus_client.registry import REGISTRY
+
+
+class RequestStatsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    @override_settings(REQUEST_STATS_SAMPLE_RATE=1)
+    def test_server_timing_header(self):
+        """Попавший в выборку запрос получает Server-Timing."""
+        with self.assertLogs('yatube.requests') as logs:
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('"url_name": "posts:index"', logs.output[0])
+        self.assertIn('hit=0', response['Server-Timing'])
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertIn('miss=0', response['Server-Timing'])
+
+    @override_settings(REQUEST_STATS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Без выборки заголовок не добавляется."""
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class MetricsViewTests(TestCase):
+    def test_metrics(self):
+        """/metrics отдаёт метрики в текстовом формате Prometheus."""
+        client = Client()
+        user = User.objects.create(username='test_user')
+        Post.objects.create(author=user, text='Тестовый пост')
+        client.get(reverse('posts:index'))
+        response = client.get(reverse('metrics'))
+        content = response.content.decode()
+        self.assertIn(
+            'yatube_request_latency_seconds_count{view="posts:index"}',
+            content
+        )
+        self.assertIn(
+            'yatube_writes_total{action="create",model="post"}', content
+        )
+        self.assertIn('yatube_cache_requests_total', content)
+
+    @override_settings(REQUEST_STATS_SAMPLE_RATE=0)
+    def test_queries_counted_without_sampling(self):
+        """Число SQL-запросов пишется для каждого ответа, не для выборки."""
+        labels = {'view': 'posts:index'}
+
+        def observed():
+            return (
+                REGISTRY.get_sample_value(
+                    'yatube_request_queries_count', labels
+                ) or 0,
+                REGISTRY.get_sample_value(
+                    'yatube_request_queries_sum', labels
+                ) or 0,
+            )
+
+        count, total = observed()
+        with CaptureQueriesContext(connection) as queries:
+            Client().get(reverse('posts:index'))
+        self.assertEqual(
+            observed(), (count + 1, total + len(queries.captured_queries))
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_closed_to_outside(self):
+        """Снаружи /metrics доступны только по токену и сотрудникам."""
+        client = Client(REMOTE_ADDR='203.0.113.5')
+        url = reverse('metrics')
+        self.assertEqual(client.get(url).status_code, HTTPStatus.FORBIDDEN)
+        response = Client().get(url, HTTP_X_FORWARDED_FOR='203.0.113.5')
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+        response = client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        client.force_login(
+            User.objects.create(username='staff', is_staff=True)
+        )
+        self.assertEqual(client.get(url).status_code, HTTPStatus.OK)
+
+    def test_clear_dir(self):
+        """При старте мастера mmap-файлы прошлого запуска удаляются."""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for name in ('counter_1.db', 'histogram_2.db', 'notes.txt'):
+            open(os.path.join(path, name), 'w').close()
+        metrics.clear_dir(path)
+        self.assertEqual(os.listdir(path), ['notes.txt'])
+
+    def test_clear_dead(self):
+        """Без gunicorn файлы завершившихся процессов тоже удаляются."""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        process = subprocess.Popen(['true'])
+        process.wait()
+        names = (f'counter_{os.getpid()}.db',
+                 f'histogram_{process.pid}.db', 'notes.txt')
+        for name in names:
+            open(os.path.join(path, name), 'w').close()
+        metrics.clear_dead(path)
+        self.assertEqual(sorted(os.listdir(path)), [names[0], names[2]])
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_runs_validated(self):
+        """Без прогонов перцентили не посчитать: команда сразу падает."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_views', runs=0, stdout=StringIO())
+
+    def test_counter_sees_other_threads(self):
+        """Запросы потоков записи и пула шардов тоже учитываются."""
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        with benchmark_views.QueryCounter() as counter:
+            query()
+            thread = threading.Thread(target=query)
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.count, 2)
+
+    def test_measure(self):
+        """Замер страницы: перцентили, запросы, размер и статус."""
+        user = User.objects.create(username='test_user')
+        Post.objects.create(author=user, text='Тестовый пост')
+        options = {'warmup': 1, 'runs': 3, 'cold': True}
+        with benchmark_views.QueryCounter() as counter:
+            result = benchmark_views.Command().measure(
+                Client(), reverse('posts:index'), 'anonymous', None,
+                counter, options
+            )
+        self.assertEqual(result['status'], [HTTPStatus.OK])
+        self.assertGreater(result['queries'], 0)
+        self.assertGreater(result['bytes'], 0)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class SlowQueryLogTests(TestCase):
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0.000001)
+    def test_slow_query_logged_with_plan(self):
+        """Медленный запрос попадает в журнал с планом и без строк."""
+        with self.assertLogs('yatube.slow_queries', 'WARNING') as logs:
+            list(User.objects.filter(username='secret'))
+        record = json.loads(logs.output[0].split(':', 2)[2])
+        self.assertEqual(record['params'], ['<str:6>'])
+        self.assertTrue(record['plan'])
+
+
+TEMP_PROFILER_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(PROFILER_DIR=TEMP_PROFILER_DIR)
+class ProfilerMiddlewareTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILER_DIR, ignore_errors=True)
+
+    def test_profile_with_token(self):
+        """С подписанным токеном профиль сохраняется в файл."""
+        response = Client().get(
+            reverse('about:author'), {'_profile': profiler.make_token()}
+        )
+        path = os.path.join(TEMP_PROFILER_DIR, response['X-Profile-File'])
+        self.assertTrue(os.path.exists(path))
+
+    def test_bad_token_ignored(self):
+        """Неверный токен не включает профайлер."""
+        response = Client().get(
+            reverse('about:author'), {'_profile': 'profile:forged'}
+        )
+        self.assertFalse(response.has_header('X-Profile-File'))
+
+
+class TracingMiddlewareTests(TestCase):
+    @override_settings(TRACING_SAMPLE_RATE=1)
+    def test_trace_exported(self):
+        """Трасса содержит вложенные span'ы представления и SQL."""
+        user = User.objects.create(username='test_user')
+        Post.objects.create(author=user, text='Тестовый пост')
+        with self.assertLogs('yatube.traces') as logs:
+            response = Client().get(reverse('posts:index'))
+        self.assertIn('traceparent', response)
+        trace = json.loads(logs.output[0].split(':', 2)[2])
+        spans = trace['resourceSpans'][0]['scopeSpans'][0]['spans']
+        by_name = {span['name']: span for span in spans}
+        self.assertIn('url.resolve', by_name)
+        self.assertEqual(
+            by_name['db.query']['parentSpanId'], by_name['view']['spanId']
+        )
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_value_is_computed_once(self):
+        """Повторное обращение не пересчитывает значение."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(caching.get_or_set('key', compute, 20), 'value')
+        caching.local.clear()
+        self.assertEqual(caching.get_or_set('key', compute, 20), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_served_while_locked(self):
+        """Пока другой процесс пересчитывает ключ, отдаётся старое значение."""
+        cache.set('key', ('old', time.time() - 1, 0.0), 20)
+        cache.add('key:lock', 1)
+        value = caching.get_or_set('key', lambda: 'new', 20)
+        self.assertEqual(value, 'old')
+
+    def test_expired_value_recomputed(self):
+        """После мягкого срока значение пересчитывается и сохраняется."""
+        cache.set('key', ('old', time.time() - 1, 0.0), 20)
+        self.assertEqual(caching.get_or_set('key', lambda: 'new', 20), 'new')
+        self.assertEqual(cache.get('key')[0], 'new')
+        self.assertIsNone(cache.get('key:lock'))
+
+    @override_settings(TIERED_CACHE_LOCK_TIMEOUT=0.05)
+    def test_foreign_lock_kept(self):
+        """Долгий пересчёт не снимает блокировку, взятую после истечения
+        его собственной."""
+        def slow_compute():
+            time.sleep(0.1)
+            self.assertTrue(cache.add('key:lock', 'other'))
+            return 'new'
+
+        self.assertEqual(caching.get_or_set('key', slow_compute, 20), 'new')
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+    def test_clear_resets_local_tier(self):
+        """cache.clear() сбрасывает и локальный уровень."""
+        caching.get_or_set('key', lambda: 'old', 20)
+        cache.clear()
+        self.assertEqual(caching.get_or_set('key', lambda: 'new', 20), 'new')
+
+
+class DonutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hole_rendered_per_request(self):
+        """Дырка во фрагменте рендерится из контекста текущего запроса."""
+        engine = Engine(
+            loaders=[('django.template.loaders.locmem.Loader', {
+                'page.html': (
+                    '{% load tiered_cache %}{% tiered_cache 20 page %}'
+                    '{{ name }}:{% donut_hole "hole.html" %}'
+                    '{% endtiered_cache %}'
+                ),
+                'hole.html': '{{ name }}',
+            })],
+            libraries={'tiered_cache': 'core.templatetags.tiered_cache'},
+        )
+        template = engine.get_template('page.html')
+        self.assertEqual(template.render(Context({'name': 'a'})), 'a:a')
+        self.assertEqual(template.render(Context({'name': 'b'})), 'a:b')
+
+
+@override_settings(READ_REPLICAS=['replica1', 'replica2'])
+class ReadReplicaRouterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='test_user')
+        User.objects.create(username='author')
+
+    def setUp(self):
+        self.router = db_routers.ReadReplicaRouter()
+        db_routers.begin_request()
+
+    def tearDown(self):
+        db_routers.end_request()
+
+    def test_reads_go_to_replica_until_write(self):
+        """Чтение идёт в одну реплику, а после записи — в основную базу."""
+        replica = self.router.db_for_read(Post)
+        self.assertIn(replica, settings.READ_REPLICAS)
+        for _ in range(20):
+            self.assertEqual(self.router.db_for_read(Post), replica)
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_write_in_get_sets_sticky_cookie(self):
+        """Подписка по GET-ссылке включает чтение из основной базы."""
+        client = Client()
+        # В тестах нет баз реплик: «реплика» запроса — основная база.
+        with mock.patch.object(db_routers, 'replica', return_value='default'):
+            client.force_login(self.user)
+            response = client.get(reverse('posts:index'))
+            self.assertNotIn(
+                settings.REPLICA_STICKY_COOKIE, response.cookies
+            )
+            response = client.get(
+                reverse('posts:profile_follow', args=['author'])
+            )
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertFalse(db_routers.is_pinned())
+
+    def test_coordinated_write_pins_primary(self):
+        """Запись через core.writes тоже считается записью запроса."""
+        db_routers.begin_request()
+        writes.run(int, '1')
+        self.assertTrue(db_routers.end_request())
+
+
+class SyncReplicasTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.sqlite3')
+        self.replica = os.path.join(self.directory, 'replica.sqlite3')
+        with sqlite3.connect(self.primary) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE item (value TEXT)')
+            connection.execute("INSERT INTO item VALUES ('снимок')")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_snapshot_leaves_wal_mode(self):
+        """Реплика — снимок без журнала WAL, старые -wal и -shm удалены."""
+        for suffix in ('-wal', '-shm'):
+            open(f'{self.replica}{suffix}', 'w').close()
+        databases = {
+            'default': {**settings.DATABASES['default'],
+                        'NAME': self.primary},
+            'replica1': {**settings.DATABASES['default'],
+                         'NAME': self.replica},
+        }
+        with warnings.catch_warnings():
+            # Команда читает из DATABASES только пути файлов.
+            warnings.simplefilter('ignore')
+            with self.settings(DATABASES=databases,
+                               READ_REPLICAS=['replica1']):
+                call_command('sync_replicas')
+        self.assertFalse(os.path.exists(f'{self.replica}-wal'))
+        self.assertFalse(os.path.exists(f'{self.replica}-shm'))
+        with sqlite3.connect(self.replica) as connection:
+            mode, = connection.execute('PRAGMA journal_mode').fetchone()
+            rows = connection.execute('SELECT value FROM item').fetchall()
+        self.assertEqual(mode, 'delete')
+        self.assertEqual(rows, [('снимок',)])
+
+
+def retry_locked(func, *args, **kwargs):
+    # Общая in-memory база тестов блокирует таблицы целиком и не ждёт
+    # блокировку: чтение во время чужого коммита и пачка записей во время
+    # чужого чтения падают с «table is locked». Упавшая пачка откатана,
+    # так что повтор ничего не дублирует.
+    for _ in range(100):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError:
+            time.sleep(0.01)
+    raise AssertionError('Таблица постов так и не освободилась')
+
+
+class ThreadClient(Client):
+    """Client для запросов из нескольких потоков сразу.
+
+    Client ловит исключения представлений сигналом got_request_exception
+    и получил бы их и из чужих потоков: повтор записи после такой чужой
+    ошибки задвоил бы её.
+    """
+
+    def request(self, **request):
+        self.thread = threading.get_ident()
+        return super().request(**request)
+
+    def store_exc_info(self, **kwargs):
+        if threading.get_ident() == self.thread:
+            super().store_exc_info(**kwargs)
+
+
+class WriteCoordinatorTests(TransactionTestCase):
+    def test_concurrent_writes_committed(self):
+        """Параллельные записи коммитятся и видны сразу после ожидания."""
+        user = User.objects.create(username='test_user')
+
+        def create(number):
+            post = retry_locked(
+                writes.run, Post.objects.create, author=user,
+                text=f'Пост {number}',
+            )
+            return retry_locked(Post.objects.filter(pk=post.pk).exists)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertTrue(all(pool.map(create, range(20))))
+        self.assertEqual(Post.objects.count(), 20)
+
+    def test_concurrent_views_see_own_writes(self):
+        """Комментарии, подписки и посты из параллельных запросов идут
+        через поток записи, и страница после редиректа уже их показывает."""
+        author = User.objects.create(username='author')
+        post = Post.objects.create(author=author, text='Пост автора')
+        readers = []
+        for number in range(6):
+            client = ThreadClient()
+            client.force_login(
+                User.objects.create(username=f'reader{number}')
+            )
+            readers.append((f'reader{number}', client))
+
+        def act(reader):
+            username, client = reader
+            response = retry_locked(
+                client.post, reverse('posts:add_comment', args=[post.pk]),
+                {'text': f'Комментарий {username}'},
+            )
+            page = retry_locked(client.get, response.url)
+            commented = f'Комментарий {username}' in (
+                page.content.decode()
+            )
+            retry_locked(
+                client.get, reverse('posts:profile_follow', args=['author'])
+            )
+            response = retry_locked(
+                client.post, reverse('posts:post_create'),
+                {'text': f'Пост {username}'},
+            )
+            page = retry_locked(client.get, response.url)
+            created = f'Пост {username}' in page.content.decode()
+            return commented, created
+
+        batches = REGISTRY.get_sample_value('yatube_write_batch_size_count')
+        with ThreadPoolExecutor(max_workers=len(readers)) as pool:
+            results = list(pool.map(act, readers))
+        self.assertEqual(results, [(True, True)] * len(readers))
+        # Записи прошли через поток записи, а не выполнились на месте.
+        self.assertGreater(
+            REGISTRY.get_sample_value('yatube_write_batch_size_count'),
+            batches or 0,
+        )
+        self.assertEqual(post.comments.count(), len(readers))
+        self.assertEqual(
+            Follow.objects.filter(author=author).count(), len(readers)
+        )
+        self.assertEqual(Post.objects.count(), len(readers) + 1)
+
+    def test_error_reaches_caller(self):
+        """Ошибка одной записи возвращается только её автору."""
+        with self.assertRaises(ValueError):
+            writes.run(int, 'не число')
+        self.assertEqual(writes.run(int, '1'), 1)
+
+    @override_settings(WRITE_TIMEOUT=0.05)
+    def test_timeout_cancels_queued_write(self):
+        """Не начатая за таймаут запись отменяется, начатая — ждётся."""
+        done = []
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(writes.run, time.sleep, 0.3)
+            time.sleep(0.05)
+            with self.assertRaises(writes.WriteTimeout):
+                writes.run(done.append, 'отменённая')
+            self.assertIsNone(slow.result())
+        writes.run(done.append, 'следующая')
+        self.assertEqual(done, ['следующая'])
+
+    def test_timeout_response(self):
+        """Таймаут записи отдаётся как 503."""
+        user = User.objects.create(username='test_user')
+        User.objects.create(username='author')
+        client = Client()
+        client.force_login(user)
+        with mock.patch.object(
+            writes, 'run', side_effect=writes.WriteTimeout
+        ):
+            response = client.get(
+                reverse('posts:profile_follow', args=['author'])
+            )
+        self.assertEqual(
+            response.status_code, HTTPStatus.SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(response['Retry-After'], '1')
+
+
+calls = []
+
+
+@tasks.task
+def record(value):
+    calls.append(value)
+
+
+@tasks.task(max_attempts=2)
+def fail():
+    raise ValueError('ошибка задачи')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_priority_and_delay(self):
+        """Сначала приоритетные задачи; отложенные ждут своего времени."""
+        record.enqueue('обычная')
+        record.enqueue('срочная', priority=5)
+        record.enqueue('отложенная', delay=60)
+        tasks.work(burst=True)
+        self.assertEqual(calls, ['срочная', 'обычная'])
+        self.assertEqual(Task.objects.get().status, Task.QUEUED)
+
+    def test_key_deduplicates(self):
+        """Задача с тем же ключом не ставится второй раз."""
+        first = record.enqueue('один', key='same')
+        second = record.enqueue('два', key='same')
+        self.assertEqual(first.pk, second.pk)
+        tasks.work(burst=True)
+        self.assertEqual(calls, ['один'])
+        record.enqueue('три', key='same')
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_task_retried(self):
+        """Ошибка откладывает повтор, после max_attempts задача падает."""
+        with self.settings(TASK_RETRY_DELAY=0), self.assertLogs(
+            'core.tasks', 'ERROR'
+        ):
+            fail.enqueue()
+            tasks.work(burst=True)
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('ошибка задачи', task.error)
+
+    def expire_lease(self):
+        Task.objects.update(
+            locked_until=timezone.now() - dt.timedelta(seconds=1)
+        )
+
+    def test_heartbeat_keeps_lease(self):
+        """Продлённую аренду не забирает другой воркер."""
+        record.enqueue('долгая')
+
+        def run(task):
+            self.expire_lease()
+            tasks.heartbeat()
+            self.assertEqual(tasks.claim('second', 1), [])
+
+        task, = tasks.claim('first', 1)
+        self.assertEqual(tasks.execute(task, run), 'done')
+        self.assertFalse(Task.objects.exists())
+
+    def test_lost_lease_stops_task(self):
+        """Задача, аренду которой забрал другой воркер, прерывается."""
+        record.enqueue('долгая')
+
+        def run(task):
+            self.expire_lease()
+            self.assertEqual(len(tasks.claim('second', 1)), 1)
+            tasks.heartbeat()
+            calls.append('после потери аренды')
+
+        task, = tasks.claim('first', 1)
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertEqual(tasks.execute(task, run), 'lost')
+        self.assertEqual(calls, [])
+        self.assertTrue(
+            Task.objects.get().locked_by.startswith('second:')
+        )
+
+    def test_expired_last_attempt_fails(self):
+        """Истёкшая аренда последней попытки не забирается снова."""
+        record.enqueue('роняет воркер')
+        Task.objects.update(status=Task.RUNNING, attempts=3)
+        self.expire_lease()
+        tasks.work(burst=True)
+        self.assertEqual(calls, [])
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+
+seen = []
+
+
+@outbox.consumer('test')
+def remember(events):
+    seen.extend((event.model, event.action) for event in events)
+
+
+class OutboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+
+    def setUp(self):
+        seen.clear()
+
+    def test_changes_recorded(self):
+        """Изменения пишутся в журнал, откат убирает и событие."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        post.text = 'Другой текст'
+        post.save()
+        try:
+            with transaction.atomic():
+                Post.objects.create(author=self.user, text='Откат')
+                raise ValueError
+        except ValueError:
+            pass
+        post.delete()
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list('action', flat=True)),
+            ['create', 'update', 'delete'],
+        )
+
+    def test_consumer_offsets(self):
+        """Потребитель получает события один раз, сброс переигрывает."""
+        Post.objects.create(author=self.user, text='Пост')
+        self.assertEqual(outbox.consume('test'), 1)
+        self.assertEqual(outbox.consume('test'), 0)
+        outbox.reset('test')
+        outbox.consume('test')
+        self.assertEqual(seen, [('posts.post', 'create')] * 2)
+
+    def test_stream_redelivers_unfinished_batch(self):
+        """Недочитанная пачка приходит снова."""
+        for number in range(3):
+            Post.objects.create(author=self.user, text=f'Пост {number}')
+        events = outbox.stream('stream')
+        next(events)
+        events.close()
+        self.assertEqual(len(list(outbox.stream('stream'))), 3)
+        self.assertEqual(list(outbox.stream('stream')), [])
+
+
+@override_settings(ESTIMATED_COUNT_THRESHOLD=3)
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+
+    def setUp(self):
+        cache.clear()
+
+    def count(self):
+        return paginator.EstimatedCountPaginator(
+            Post.objects.all(), 10, count_key='posts'
+        ).count
+
+    def test_small_counts_exact(self):
+        """Ниже порога число объектов считается точно."""
+        Post.objects.create(author=self.user, text='Пост')
+        self.assertEqual(self.count(), 1)
+        Post.objects.create(author=self.user, text='Пост')
+        self.assertEqual(self.count(), 2)
+
+    def test_large_counts_cached(self):
+        """Выше порога число берётся из кеша и сдвигается счётчиком."""
+        for number in range(3):
+            Post.objects.create(author=self.user, text=f'Пост {number}')
+        self.assertEqual(self.count(), 3)
+        Post.objects.create(author=self.user, text='Новый пост')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 3)
+        paginator.adjust('posts', 1)
+        self.assertEqual(self.count(), 4)
+
+    def test_key_from_query(self):
+        """Без имени счётчика ключ зависит от запроса."""
+        for number in range(3):
+            Post.objects.create(author=self.user, text=f'Пост {number}')
+        first = paginator.EstimatedCountPaginator(Post.objects.all(), 10)
+        other = paginator.EstimatedCountPaginator(
+            Post.objects.filter(text='Пост 1'), 10
+        )
+        self.assertNotEqual(first.key(), other.key())
+        self.assertEqual(first.count, 3)
+        self.assertEqual(other.count, 1)
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('yatube.traces')
+_local = threading.local()
+
+SERVICE_NAME = 'yatube'
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.stack = []
+
+    def open(self, name, kind, attributes):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': os.urandom(8).hex(),
+            'name': name,
+            'kind': kind,
+            'startTimeUnixNano': time.time_ns(),
+            'attributes': attributes,
+        }
+        if self.stack:
+            span['parentSpanId'] = self.stack[-1]['spanId']
+        self.stack.append(span)
+        return span
+
+    def close(self, span, error=None):
+        span['endTimeUnixNano'] = time.time_ns()
+        if error is not None:
+            span['status'] = {'code': STATUS_ERROR, 'message': repr(error)}
+        self.stack.remove(span)
+        self.spans.append(span)
+
+
+def start():
+    _local.trace = Trace()
+    return _local.trace
+
+
+def stop():
+    trace, _local.trace = current(), None
+    return trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """Вложенный span; вне трассируемого запроса ничего не делает."""
+    trace = current()
+    if trace is None:
+        yield None
+        return
+    opened = trace.open(name, kind, attributes)
+    try:
+        yield opened
+    except Exception as error:
+        trace.close(opened, error)
+        raise
+    trace.close(opened)
+
+
+def attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def export(trace):
+    """Пишет трассу строкой JSONL в формате OTLP/JSON."""
+    spans = []
+    for item in trace.spans:
+        item = dict(item)
+        item['attributes'] = [
+            {'key': key, 'value': attribute_value(value)}
+            for key, value in item['attributes'].items()
+            if value is not None
+        ]
+        item['startTimeUnixNano'] = str(item['startTimeUnixNano'])
+        item['endTimeUnixNano'] = str(item['endTimeUnixNano'])
+        spans.append(item)
+    logger.info(json.dumps({
+        'resourceSpans': [{
+            'resource': {'attributes': [{
+                'key': 'service.name',
+                'value': {'stringValue': SERVICE_NAME},
+            }]},
+            'scopeSpans': [{
+                'scope': {'name': SERVICE_NAME},
+                'spans': spans,
+            }],
+        }],
+    }, ensure_ascii=False))
+
+
+def query_wrapper(execute, sql, params, many, context):
+    connection = context['connection']
+    with span('db.query', KIND_CLIENT, **{
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.statement': sql,
+    }):
+        return execute(sql, params, many, context)
+
+
+def traced_render(render):
+    """Обёртка для django.template.base.Template._render."""
+    def wrapper(self, context):
+        if current() is None:
+            return render(self, context)
+        with span('template.render', **{'template.name': self.name}):
+            return render(self, context)
+    wrapper.__wrapped__ = render
+    return wrapper
@@ -1,6 +1,13 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from . import metrics
 
 
 def page_not_found(request, exception):
@@ -15,8 +22,37 @@ def csrf_failure(request, reason=''):
 
 
 def permission_denied(request, exception):
-    return render(request, 'core/403.html', HTTPStatus.FORBIDDEN)
+    return render(request, 'core/403.html', status=HTTPStatus.FORBIDDEN)
 
 
 def server_error(request):
-    return render(request, 'core/500.html', HTTPStatus.INTERNAL_SERVER_ERROR)
+    return render(
+        request, 'core/500.html', status=HTTPStatus.INTERNAL_SERVER_ERROR
+    )
+
+
+def service_unavailable(request, exception=None):
+    response = render(
+        request, 'core/503.html', status=HTTPStatus.SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = '1'
+    return response
+
+
+def can_read_metrics(request):
+    # Запрос через прокси приходит с адреса прокси, часто локального.
+    if ('HTTP_X_FORWARDED_FOR' not in request.META
+            and request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        return True
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    ):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    if not can_read_metrics(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,123 @@
+"""Групповые коммиты для мелких записей.
+
+SQLite пускает одного писателя, и под параллельными комментариями и
+подписками запросы ждут блокировку или падают с «database is locked».
+Здесь все мелкие записи процесса выполняет один поток: он забирает из
+очереди всё, что накопилось (до WRITE_BATCH_SIZE), и коммитит пачку одной
+транзакцией, каждую запись — в своей точке сохранения. Запрос ждёт свой
+Future и после него уже видит закоммиченную запись.
+
+Транзакция пачки открыта во всех базах постов (основной и шардах), так
+что ошибка пачки откатывает и записи в шарды; коммиты баз при этом идут
+по очереди, без двухфазного коммита.
+
+Запись, которую поток ещё не начал за WRITE_TIMEOUT, отменяется, и
+запрос получает WriteTimeout (ответ 503). Начатую запись запрос
+дожидается без таймаута: иначе она закоммитилась бы уже после ошибки.
+"""
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from . import db_routers, metrics, tracing
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+
+
+class WriteTimeout(Exception):
+    """Запись не начата за WRITE_TIMEOUT и отменена."""
+
+
+def run(func, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) в ближайшем групповом коммите.
+
+    Внутри транзакции (и в самом потоке записи) вызов выполняется сразу:
+    ждать чужого коммита там нельзя.
+    """
+    # Запись идёт в другом потоке, и роутеры её в этом запросе не видят.
+    db_routers.mark_written()
+    if not settings.WRITE_COORDINATOR or connection.in_atomic_block:
+        return func(*args, **kwargs)
+    future = Future()
+    _queue.put((func, args, kwargs, future))
+    start_worker()
+    with tracing.span('write.wait'):
+        try:
+            return future.result(timeout=settings.WRITE_TIMEOUT)
+        except TimeoutError:
+            if future.cancel():
+                raise WriteTimeout(func) from None
+        return future.result()
+
+
+def start_worker():
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=work, name='yatube-writes', daemon=True
+            )
+            _worker.start()
+
+
+def next_batch():
+    batch = []
+    while not batch or len(batch) < settings.WRITE_BATCH_SIZE:
+        try:
+            item = _queue.get(block=not batch)
+        except queue.Empty:
+            break
+        # Отменённые по таймауту записи пропускаются, остальные с этого
+        # момента отменить уже нельзя.
+        if item[3].set_running_or_notify_cancel():
+            batch.append(item)
+    return batch
+
+
+def databases():
+    return list(dict.fromkeys(['default', *settings.POST_SHARDS]))
+
+
+def atomic():
+    """transaction.atomic() сразу во всех базах постов."""
+    stack = ExitStack()
+    for alias in databases():
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+def commit(batch):
+    metrics.WRITE_BATCHES.observe(len(batch))
+    results = []
+    try:
+        with atomic():
+            for func, args, kwargs, future in batch:
+                try:
+                    with atomic():
+                        results.append((future, func(*args, **kwargs), None))
+                except Exception as error:
+                    results.append((future, None, error))
+    except Exception as error:
+        for _, _, _, future in batch:
+            future.set_exception(error)
+        return
+    for future, result, error in results:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+
+def work():
+    while True:
+        batch = next_batch()
+        close_old_connections()
+        commit(batch)
@@ -0,0 +1,18 @@
+"""Настройки gunicorn: метрики prometheus_client по нескольким воркерам."""
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+wsgi_app = 'yatube.wsgi'
+
+
+def on_starting(server):
+    # Значения воркеров прошлого запуска иначе попадут в новые суммы.
+    from core import metrics
+    from django.conf import settings
+    metrics.clear_dir(settings.METRICS_DIR)
+
+
+def child_exit(server, worker):
+    from core import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -1,10 +1,115 @@
+from core import outbox
+from core.models import OutboxEvent
+from core.paginator import EstimatedCountPaginator
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.core.exceptions import ValidationError
+from django.db import transaction
 
-from .models import Comment, Group, Post
+from . import deletion, feed, search, sharding
+from .models import Comment, DeletionJob, Group, Post, is_detached
+
+KEYSET_VAR = 'before'
+SHARD_VAR = 'shard'
+
+
+class ShardFilter(admin.SimpleListFilter):
+    """Выбор шарда списка; без параметра показывается первый шард."""
+    title = 'шард'
+    parameter_name = SHARD_VAR
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.POST_SHARDS]
+
+    def queryset(self, request, queryset):
+        # Базу уже выбрал ShardAdminMixin.get_queryset().
+        return queryset
+
+    def choices(self, changelist):
+        current = self.value() or settings.POST_SHARDS[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == current,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}
+                ),
+                'display': title,
+            }
+
+
+class ShardAdminMixin:
+    """Админка постов и комментариев, разложенных по шардам.
+
+    Список показывает один шард (фильтр «шард»), объект для правки и
+    удаления ищется в шарде по своему id. Сохранение само уходит в нужный
+    шард через posts.sharding.PostShardRouter.
+    """
+
+    def shard(self, request):
+        alias = getattr(request, 'shard', None) or request.GET.get(SHARD_VAR)
+        return alias if alias in settings.POST_SHARDS else None
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if sharding.is_sharded():
+            return (ShardFilter, *list_filter)
+        return list_filter
+
+    def get_list_select_related(self, request):
+        # В шарде нет пользователей и групп, JOIN с ними невозможен.
+        if is_detached(self.shard(request)):
+            return ()
+        return super().get_list_select_related(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        alias = self.shard(request)
+        if alias is None:
+            return queryset
+        queryset = queryset.using(alias)
+        if is_detached(alias):
+            queryset = queryset.prefetch_related(*self.list_select_related)
+        return queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        if (sharding.is_sharded() and from_field is None
+                and str(object_id).isdigit()):
+            request.shard = sharding.shard_for_post(object_id)
+        return super().get_object(request, object_id, from_field)
+
+
+class PostChoiceField(forms.ModelChoiceField):
+    """Пост по id, найденный в своём шарде."""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return sharding.post_queryset(value).get(pk=value)
+        except (ValueError, TypeError, Post.DoesNotExist):
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice'
+            )
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(), required=False, label='Группа'
+    )
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ShardAdminMixin, admin.ModelAdmin):
+    """Список постов, которому не мешает их число.
+
+    Авторы и группы строк читаются одним JOIN, варианты групп для
+    list_editable и действия — одним запросом на страницу, число постов —
+    по оценке без второго COUNT. Поиск идёт по индексу posts.search, а
+    ссылка «Следующие» листает по ?before=<id> без OFFSET.
+    """
     list_display = (
         'pk',
         'text',
@@ -13,11 +118,101 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    ordering = ('-pk',)
     empty_value_display = '-пусто-'
+    actions = ('delete_in_background', 'move_to_group')
+    action_form = PostActionForm
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def group_choices(self, request):
+        if not hasattr(request, '_group_choices'):
+            field = forms.ModelChoiceField(Group.objects.all())
+            request._group_choices = list(iter(field.choices))
+        return request._group_choices
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            formfield.choices = self.group_choices(request)
+        return formfield
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        before = getattr(request, 'keyset_before', None)
+        if before is not None:
+            queryset = queryset.filter(pk__lt=before)
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        return search.search(queryset, search_term), False
+
+    def changelist_view(self, request, extra_context=None):
+        # ChangeList не знает параметра before и отвергает его.
+        params = request.GET.copy()
+        before = params.pop(KEYSET_VAR, [''])[-1]
+        if before.isdigit():
+            request.keyset_before = int(before)
+        request.GET = params
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None)
+        if not context or 'cl' not in context:
+            return response
+        context['action_form'].fields['group'].choices = (
+            self.group_choices(request)
+        )
+        cl = context['cl']
+        posts = list(cl.result_list)
+        if len(posts) == cl.list_per_page and ORDER_VAR not in params:
+            context['keyset_next'] = cl.get_query_string(
+                {KEYSET_VAR: posts[-1].pk}, [PAGE_VAR]
+            )
+        return response
+
+    def delete_in_background(self, request, queryset):
+        for post in queryset:
+            deletion.schedule_post(post)
+        self.message_user(
+            request, 'Посты скрыты и поставлены в очередь на удаление.'
+        )
+    delete_in_background.short_description = 'Удалить в фоне'
+
+    def move_to_group(self, request, queryset):
+        # Группа уже проверена формой действия.
+        group_id = request.POST.get('group') or None
+        with transaction.atomic(using=queryset.db):
+            outbox.record_queryset(queryset, OutboxEvent.UPDATE)
+            updated = queryset.update(group_id=group_id)
+        feed.bump_generation()
+        self.message_user(request, f'Перенесено постов: {updated}.')
+    move_to_group.short_description = 'Перенести в группу'
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'object_id', 'status', 'deleted',
+                    'created', 'finished')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'object_id', 'status', 'deleted', 'error',
+                       'created', 'finished')
+
+
+@admin.register(Comment)
+class CommentAdmin(ShardAdminMixin, admin.ModelAdmin):
+    list_display = ('pk', 'text', 'post', 'author', 'created')
+    list_select_related = ('post', 'author')
+    raw_id_fields = ('post', 'author')
+    ordering = ('-pk',)
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'post':
+            kwargs['form_class'] = PostChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-admin.site.register(Comment)
 
 admin.site.register(Group)
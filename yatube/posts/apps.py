@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import deletion, feed, lookups, sharding
+        deletion.connect_signals()
+        feed.connect_signals()
+        lookups.connect_signals()
+        sharding.connect_signals()
@@ -0,0 +1,291 @@
+"""Архив старых постов и комментариев.
+
+В горячих таблицах posts_post и posts_comment остаются только посты
+моложе ARCHIVE_AFTER_DAYS: по ним работают главная и ленты групп и
+подписок. Более старые посты команда archive_posts переносит вместе с
+комментариями в годовые таблицы posts_post_<год> и posts_comment_<год>
+базы ARCHIVE_DATABASE. Годовые таблицы перечислены в ArchivePartition
+вместе с диапазоном id, по которому post_detail находит архивный пост;
+профиль автора показывает сначала горячие посты, затем архивные.
+"""
+import threading
+from collections import defaultdict
+
+from core import outbox
+from core.models import OutboxEvent
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models, transaction
+
+from . import feed, sharding
+from .models import (ArchivePartition, Comment, Group, Post, PostQuerySet,
+                     User)
+
+PARTITIONS_KEY = 'archive:partitions'
+
+_models = {}
+_lock = threading.Lock()
+
+
+class ArchivedPostBase(models.Model):
+    text = models.TextField()
+    pub_date = models.DateTimeField()
+    author = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False,
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False,
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        blank=True
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    is_archived = True
+
+    def __str__(self):
+        return self.text[:15]
+
+    class Meta:
+        abstract = True
+        managed = False
+        ordering = ['-pub_date']
+
+
+class ArchivedCommentBase(models.Model):
+    text = models.TextField()
+    author = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        db_constraint=False,
+    )
+    created = models.DateTimeField()
+
+    is_archived = True
+
+    class Meta:
+        abstract = True
+        managed = False
+
+
+def create_models(period):
+    post_model = type(f'ArchivedPost{period}', (ArchivedPostBase,), {
+        '__module__': __name__,
+        'Meta': type('Meta', (ArchivedPostBase.Meta,), {
+            'db_table': f'posts_post_{period}',
+        }),
+    })
+    comment_model = type(f'ArchivedComment{period}', (ArchivedCommentBase,), {
+        '__module__': __name__,
+        'post': models.ForeignKey(
+            post_model,
+            on_delete=models.DO_NOTHING,
+            related_name='comments',
+            db_constraint=False,
+        ),
+        'Meta': type('Meta', (ArchivedCommentBase.Meta,), {
+            'db_table': f'posts_comment_{period}',
+        }),
+    })
+    return post_model, comment_model
+
+
+def partition_models(period):
+    """Модели поста и комментария годовой таблицы архива."""
+    # Модель регистрируется в реестре приложений, создаётся один раз.
+    with _lock:
+        if period not in _models:
+            _models[period] = create_models(period)
+        return _models[period]
+
+
+def partitions():
+    """(год, первый id, последний id) годовых таблиц, новые первыми."""
+    values = cache.get(PARTITIONS_KEY)
+    if values is None:
+        values = list(ArchivePartition.objects.exclude(
+            first_id=None
+        ).values_list('period', 'first_id', 'last_id'))
+        cache.set(PARTITIONS_KEY, values, None)
+    return values
+
+
+def get_post(post_id):
+    """Архивный пост по id или None."""
+    for period, first_id, last_id in partitions():
+        if first_id <= int(post_id) <= last_id:
+            post_model, _ = partition_models(period)
+            post = post_model.objects.using(
+                settings.ARCHIVE_DATABASE
+            ).with_related().filter(pk=post_id).first()
+            if post is not None:
+                return post
+    return None
+
+
+class ArchivedFeed:
+    """Несколько querysets подряд, которые понимает Paginator."""
+
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        posts = []
+        for queryset, size in zip(self.querysets, self.counts()):
+            if start < size and stop > 0:
+                posts += queryset[max(start, 0):min(stop, size)]
+            start, stop = start - size, stop - size
+        return posts
+
+
+def posts_of(author):
+    """Посты автора: горячие, затем архивные по годам."""
+    hot = sharding.posts_of(author).visible().with_related()
+    if not partitions():
+        return hot
+    archived = [
+        partition_models(period)[0].objects.using(
+            settings.ARCHIVE_DATABASE
+        ).filter(author_id=author.pk).visible().with_related()
+        for period, _, _ in partitions()
+    ]
+    return ArchivedFeed([hot, *archived])
+
+
+def create_partition(period):
+    post_model, comment_model = partition_models(period)
+    connection = connections[settings.ARCHIVE_DATABASE]
+    if post_model._meta.db_table not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(post_model)
+            editor.create_model(comment_model)
+    partition, _ = ArchivePartition.objects.get_or_create(period=period)
+    return partition
+
+
+def copy(model, instance):
+    return model(**{
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    })
+
+
+def archive_chunk(alias, horizon, size, after=0):
+    """Переносит в архив до size постов шарда alias старше horizon с id
+    больше after; возвращает (просмотрено, перенесено, последний id).
+
+    Сначала посты копируются, затем удаляются из горячих таблиц. Если
+    команду прервать между этими шагами, повторный запуск скопирует их
+    ещё раз (дубликаты по id пропускаются) и удалит. Пост, к которому
+    после копирования добавили комментарий, остаётся до следующего
+    запуска: удаляются только скопированные строки. Следующую пачку
+    нужно брать после последнего id, иначе такие посты выбираются снова.
+    """
+    posts = list(Post.objects.using(alias).filter(
+        pub_date__lt=horizon, id__gt=after
+    ).order_by('id')[:size])
+    if not posts:
+        return 0, 0, after
+    ids = [post.pk for post in posts]
+    comments = defaultdict(list)
+    for comment in Comment.objects.using(alias).filter(post_id__in=ids):
+        comments[comment.post_id].append(comment)
+    by_period = defaultdict(list)
+    for post in posts:
+        by_period[post.pub_date.year].append(post)
+
+    for period, period_posts in by_period.items():
+        partition = create_partition(period)
+        post_model, comment_model = partition_models(period)
+        with transaction.atomic(using=settings.ARCHIVE_DATABASE):
+            post_model.objects.using(settings.ARCHIVE_DATABASE).bulk_create(
+                [copy(post_model, post) for post in period_posts],
+                ignore_conflicts=True,
+            )
+            comment_model.objects.using(
+                settings.ARCHIVE_DATABASE
+            ).bulk_create(
+                [copy(comment_model, comment)
+                 for post in period_posts for comment in comments[post.pk]],
+                ignore_conflicts=True,
+            )
+        first_id = min(post.pk for post in period_posts)
+        last_id = max(post.pk for post in period_posts)
+        partition.first_id = min(partition.first_id or first_id, first_id)
+        partition.last_id = max(partition.last_id or last_id, last_id)
+        partition.save(update_fields=['first_id', 'last_id'])
+    cache.delete(PARTITIONS_KEY)
+
+    # Без сигналов post_delete на каждую строку: ленты сбрасываются
+    # один раз на пачку.
+    with transaction.atomic(using=alias):
+        late = set(Comment.objects.using(alias).filter(
+            post_id__in=ids
+        ).exclude(pk__in=[
+            comment.pk for post_comments in comments.values()
+            for comment in post_comments
+        ]).values_list('post_id', flat=True))
+        moved = [post for post in posts if post.pk not in late]
+        post_ids = [post.pk for post in moved]
+        comment_ids = [comment.pk for post in moved
+                       for comment in comments[post.pk]]
+        Comment.objects.using(alias).filter(
+            pk__in=comment_ids
+        )._raw_delete(alias)
+        Post.objects.using(alias).filter(pk__in=post_ids)._raw_delete(alias)
+        # Для счётчиков лент: пост ушёл с главной и из группы, но не из
+        # профиля, который показывает и архив, поэтому без author_id.
+        outbox.record_many(Comment, comment_ids, OutboxEvent.DELETE, alias)
+        outbox.record_many(
+            Post, post_ids, OutboxEvent.DELETE, alias,
+            {post.pk: {'group_id': post.group_id} for post in moved},
+        )
+    feed.bump_generation()
+    return len(posts), len(moved), ids[-1]
+
+
+class ArchiveRouter:
+    """Архивные таблицы живут в ARCHIVE_DATABASE."""
+
+    def db_for_read(self, model, **hints):
+        if getattr(model, 'is_archived', False):
+            return settings.ARCHIVE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if getattr(obj1, 'is_archived', False) or getattr(
+            obj2, 'is_archived', False
+        ):
+            return True
+        return None
@@ -0,0 +1,53 @@
+import csv
+import itertools
+import json
+
+from django.core.cache import cache
+from django.db import connections
+
+from . import sharding
+from .models import Comment, Post
+
+# Модели с датами auto_now_add, которые при импорте берутся из данных.
+DATED_MODELS = (Post, Comment)
+
+
+def bulk_create(model, objects, **kwargs):
+    """sharding.bulk_create, который не заменяет даты объектов текущим
+    временем: у постов и комментариев поля пишутся как есть (raw)."""
+    if model in DATED_MODELS:
+        kwargs['raw'] = True
+    return sharding.bulk_create(model, objects, **kwargs)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def read_records(path, file_format):
+    """Построчно читает JSONL или CSV, не загружая файл целиком."""
+    with open(path, encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def finalize(using='default'):
+    """Пересчёт после массовой загрузки: статистика планировщика и кеш.
+
+    Индексы во время загрузки не отключаются: SQLite обновляет их при
+    каждой вставке, и пересоздавать их после загрузки не нужно.
+    """
+    connection = connections[using]
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    cache.clear()
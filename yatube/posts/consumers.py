@@ -0,0 +1,38 @@
+"""Потребители журнала изменений (core.outbox)."""
+import json
+
+from core import outbox, paginator
+from core.models import OutboxEvent
+
+from . import tasks
+
+
+@outbox.consumer('thumbnails')
+def enqueue_thumbnails(events):
+    """Ставит в очередь превью для новых и изменённых картинок постов."""
+    for event in events:
+        if event.model != 'posts.post' or event.action == OutboxEvent.DELETE:
+            continue
+        image = json.loads(event.payload).get('image')
+        if image:
+            tasks.make_thumbnail.enqueue(image, key=f'thumbnail:{image}')
+
+
+@outbox.consumer('counts')
+def adjust_counts(events):
+    """Сдвигает оценки числа постов для пагинации лент.
+
+    Повторно доставленная пачка сдвинет их ещё раз; ошибку исправит
+    пересчёт по истечении ESTIMATED_COUNT_TIMEOUT.
+    """
+    for event in events:
+        if event.model != 'posts.post' or event.action == OutboxEvent.UPDATE:
+            continue
+        delta = 1 if event.action == OutboxEvent.CREATE else -1
+        paginator.adjust('index', delta)
+        values = json.loads(event.payload)
+        # У пакетных удалений (posts.deletion) полей в событии нет.
+        if 'author_id' in values:
+            paginator.adjust(f'profile:{values["author_id"]}', delta)
+        if values.get('group_id'):
+            paginator.adjust(f'group:{values["group_id"]}', delta)
@@ -0,0 +1,179 @@
+"""Фоновое удаление пользователей и постов.
+
+User.delete() автора с тысячами постов собирает все связанные строки в
+память и удаляет их одной долгой транзакцией, которая держит блокировку
+записи. Вместо этого создаётся DeletionJob: пользователь сразу
+деактивируется, его посты (или пост задания) сразу пропадают из лент, а
+строки удаляются пачками по DELETION_CHUNK_SIZE, каждая своей короткой
+транзакцией. Задание выполняет задача очереди core.tasks (воркер
+run_tasks) или команда process_deletions; картинки удалённых постов с их
+превью стирают отдельные задачи. Прерванное задание продолжается с того
+же места: каждый шаг просто удаляет то, что ещё осталось. Оба способа
+забирают одну и ту же задачу очереди по ключу task_key(), поэтому одно
+задание не выполняется дважды одновременно, а каждая пачка продлевает
+аренду задачи.
+
+Обычный delete() пользователя или группы (админка, shell) собирает
+связанные строки только в своей базе; сигналы pre_delete дочищают шарды
+и архив теми же шагами.
+"""
+import time
+
+from core import outbox
+from core.models import OutboxEvent
+from core.tasks import LeaseLost, heartbeat
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.utils import timezone
+
+from . import archive, feed, sharding, tasks
+from .models import Comment, DeletionJob, Follow, Group, Post, User
+
+
+def schedule_user(user):
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    return schedule(DeletionJob.USER, user.pk)
+
+
+def schedule_post(post):
+    return schedule(DeletionJob.POST, post.pk)
+
+
+def schedule(kind, object_id):
+    job, _ = DeletionJob.objects.unfinished().get_or_create(
+        kind=kind, object_id=object_id
+    )
+    DeletionJob.objects.forget_hidden()
+    transaction.on_commit(DeletionJob.objects.forget_hidden)
+    feed.bump_generation()
+    transaction.on_commit(feed.bump_generation)
+    enqueue(job)
+    return job
+
+
+def task_key(job):
+    return f'deletion:{job.pk}'
+
+
+def enqueue(job):
+    return tasks.process_deletion.enqueue(job.pk, key=task_key(job))
+
+
+def archived_models():
+    return [archive.partition_models(period)
+            for period, _, _ in archive.partitions()]
+
+
+def user_steps(user_id):
+    """Querysets, которые удаляются по очереди; пользователь — последним."""
+    yield Follow.objects.filter(user_id=user_id)
+    yield Follow.objects.filter(author_id=user_id)
+    for alias in settings.POST_SHARDS:
+        yield Comment.objects.using(alias).filter(author_id=user_id)
+        yield Comment.objects.using(alias).filter(post__author_id=user_id)
+        yield Post.objects.using(alias).filter(author_id=user_id)
+    for post_model, comment_model in archived_models():
+        yield comment_model.objects.filter(author_id=user_id)
+        yield comment_model.objects.filter(post__author_id=user_id)
+        yield post_model.objects.filter(author_id=user_id)
+
+
+def post_steps(post_id):
+    alias = sharding.shard_for_post(post_id)
+    yield Comment.objects.using(alias).filter(post_id=post_id)
+    yield Post.objects.using(alias).filter(pk=post_id)
+    for post_model, comment_model in archived_models():
+        yield comment_model.objects.filter(post_id=post_id)
+        yield post_model.objects.filter(pk=post_id)
+
+
+def delete_chunks(job, queryset, size, pause):
+    model = queryset.model
+    has_images = any(
+        field.name == 'image' for field in model._meta.concrete_fields
+    )
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:size])
+        if not ids:
+            return
+        chunk = model.objects.using(queryset.db).filter(pk__in=ids)
+        images = []
+        if has_images:
+            images = list(chunk.exclude(image='').values_list(
+                'image', flat=True
+            ))
+        # Без сборщика Django и сигналов на каждую строку: зависимые
+        # строки удалены предыдущими шагами.
+        with transaction.atomic(using=queryset.db):
+            chunk._raw_delete(queryset.db)
+            if model._meta.label in outbox.TRACKED_MODELS:
+                outbox.record_many(
+                    model, ids, OutboxEvent.DELETE, queryset.db
+                )
+        if job is not None:
+            DeletionJob.objects.filter(pk=job.pk).update(
+                deleted=F('deleted') + len(ids)
+            )
+        for name in images:
+            tasks.delete_image.enqueue(name)
+        feed.bump_generation()
+        heartbeat()
+        time.sleep(pause)
+
+
+def process(job, size=None, pause=0):
+    """Выполняет задание до конца или до первой ошибки."""
+    size = size or settings.DELETION_CHUNK_SIZE
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status=DeletionJob.RUNNING
+    )
+    try:
+        if job.kind == DeletionJob.USER:
+            for queryset in user_steps(job.object_id):
+                delete_chunks(job, queryset, size, pause)
+            # Зависимых строк почти не осталось, сборщик справится быстро.
+            User.objects.filter(pk=job.object_id).delete()
+        else:
+            for queryset in post_steps(job.object_id):
+                delete_chunks(job, queryset, size, pause)
+    except LeaseLost:
+        # Задание продолжает воркер, который забрал задачу.
+        raise
+    except Exception as error:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.FAILED, error=repr(error)
+        )
+        raise
+    DeletionJob.objects.filter(pk=job.pk).update(
+        status=DeletionJob.DONE, finished=timezone.now()
+    )
+    DeletionJob.objects.forget_hidden()
+
+
+def delete_user_elsewhere(sender, instance, using, **kwargs):
+    """Строки пользователя в других базах: сборщик Django их не видит."""
+    for queryset in user_steps(instance.pk):
+        if queryset.db != using:
+            delete_chunks(None, queryset, settings.DELETION_CHUNK_SIZE, 0)
+
+
+def clear_group_elsewhere(sender, instance, using, **kwargs):
+    """SET_NULL для постов группы в других шардах и в архиве."""
+    for alias in settings.POST_SHARDS:
+        if alias == using:
+            continue
+        posts = Post.objects.using(alias).filter(group_id=instance.pk)
+        with transaction.atomic(using=alias):
+            outbox.record_queryset(posts, OutboxEvent.UPDATE)
+            posts.update(group=None)
+    for post_model, _ in archived_models():
+        post_model.objects.filter(group_id=instance.pk).update(group=None)
+    feed.bump_generation()
+
+
+def connect_signals():
+    pre_delete.connect(delete_user_elsewhere, sender=User)
+    pre_delete.connect(clear_group_elsewhere, sender=Group)
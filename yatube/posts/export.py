@@ -0,0 +1,113 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import archive, sharding
+from .models import Comment, DeletionJob, Group
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+COLUMNS = ('type', 'id', 'post_id', 'date', 'group', 'image', 'text')
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def post_querysets(author):
+    """Посты автора в его шарде и в годовых таблицах архива."""
+    yield sharding.posts_of(author)
+    for period, _, _ in archive.partitions():
+        post_model, _ = archive.partition_models(period)
+        yield post_model.objects.using(settings.ARCHIVE_DATABASE).filter(
+            author_id=author.pk
+        )
+
+
+def comment_querysets(author):
+    """Комментарии автора: они лежат в шардах постов, а не автора."""
+    for alias in settings.POST_SHARDS:
+        yield Comment.objects.using(alias).filter(author_id=author.pk)
+    for period, _, _ in archive.partitions():
+        _, comment_model = archive.partition_models(period)
+        yield comment_model.objects.using(settings.ARCHIVE_DATABASE).filter(
+            author_id=author.pk
+        )
+
+
+def iter_rows(author, build_url=None):
+    """Посты и комментарии автора, без загрузки всей выборки в память.
+
+    Посты, которые ждут фонового удаления, и комментарии к ним
+    пропускаются, как и в лентах. Шарды и архив читаются по очереди,
+    поэтому строки упорядочены по id только внутри каждой базы.
+    """
+    # В шардах и архиве нет таблицы групп, slug подставляется здесь.
+    groups = dict(Group.objects.values_list('pk', 'slug'))
+    for queryset in post_querysets(author):
+        posts = (
+            queryset.visible()
+            .order_by('pk')
+            .values_list('pk', 'pub_date', 'group_id', 'image', 'text')
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        for pk, pub_date, group_id, image, text in posts:
+            if image and build_url is not None:
+                image = build_url(image)
+            yield {
+                'type': 'post',
+                'id': pk,
+                'post_id': pk,
+                'date': pub_date,
+                'group': groups.get(group_id, ''),
+                'image': image or '',
+                'text': text,
+            }
+    hidden_authors, hidden_posts = DeletionJob.objects.hidden()
+    for queryset in comment_querysets(author):
+        comments = (
+            queryset
+            .exclude(post_id__in=hidden_posts)
+            .exclude(post__author_id__in=hidden_authors)
+            .order_by('pk')
+            .values_list('pk', 'post_id', 'created', 'text')
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        for pk, post_id, created, text in comments:
+            yield {
+                'type': 'comment',
+                'id': pk,
+                'post_id': post_id,
+                'date': created,
+                'group': '',
+                'image': '',
+                'text': text,
+            }
+
+
+def stream_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        row['date'] = row['date'].isoformat()
+        yield writer.writerow(row)
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def stream(rows, export_format):
+    if export_format == 'csv':
+        return stream_csv(rows)
+    return stream_jsonl(rows)
@@ -0,0 +1,219 @@
+"""Компактные записи ленты для кеша.
+
+Вместо pickle моделей Post и User в кеш кладётся marshal-дамп списка
+кортежей: страница из десяти постов занимает несколько килобайт, а для
+её вывода не нужен ORM. marshal не переносим между версиями Python, но
+общий кеш читают процессы одной сборки.
+
+Записи и кешируемые фрагменты сбрасываются сменой поколения, которое
+входит в их ключи (version()). Общее поколение меняют группы, видимые
+поля пользователей, удаления и архивация; изменение поста меняет только
+поколения главной, его автора, группы и самого поста, комментарий —
+только поколение поста, подписка — ленту подписчика.
+"""
+import datetime as dt
+import logging
+import marshal
+
+from core import caching
+from core.signals import replicas_synced
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.text import Truncator
+from sorl.thumbnail import get_thumbnail
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'feed:generation'
+# Поля пользователя, которые выводятся в лентах и на страницах постов.
+SHOWN_USER_FIELDS = ('username', 'first_name', 'last_name')
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+class FeedEntry:
+    __slots__ = ('id', 'text', 'timestamp', 'author_name',
+                 'author_username', 'group_slug', 'group_title', 'image_url')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @property
+    def pub_date(self):
+        return dt.datetime.fromtimestamp(self.timestamp, dt.timezone.utc)
+
+
+def thumbnail_url(image):
+    if not image:
+        return ''
+    try:
+        return get_thumbnail(
+            image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS
+        ).url
+    except Exception:
+        # Так же ведёт себя {% thumbnail %} при THUMBNAIL_DEBUG = False.
+        logger.exception('Не удалось создать превью для %s', image)
+        return ''
+
+
+def from_post(post):
+    return FeedEntry(
+        post.pk,
+        Truncator(post.text).chars(settings.FEED_EXCERPT_LENGTH),
+        post.pub_date.timestamp(),
+        post.author.get_full_name(),
+        post.author.username,
+        post.group.slug if post.group else '',
+        post.group.title if post.group else '',
+        thumbnail_url(post.image),
+    )
+
+
+def dumps(entries):
+    return marshal.dumps([entry.as_tuple() for entry in entries])
+
+
+def loads(data):
+    return [FeedEntry(*values) for values in marshal.loads(data)]
+
+
+def generation_key(*scope):
+    return ':'.join([GENERATION_KEY, *map(str, scope)])
+
+
+def current(key):
+    value = cache.get(key)
+    if value is None:
+        # Начинаем не с нуля: если вытеснен только счётчик, старые
+        # записи не должны снова стать актуальными.
+        value = int(dt.datetime.now().timestamp() * 1000)
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+    return value
+
+
+def generation(*scope):
+    """Общее поколение или поколение области, например ('group', 1)."""
+    return current(generation_key(*scope))
+
+
+def version(*scopes):
+    """Часть ключа кеша: общее поколение и поколения областей scopes."""
+    keys = [generation_key(*scope) for scope in ((), *scopes)]
+    found = cache.get_many(keys)
+    return '.'.join(
+        str(found[key] if key in found else current(key)) for key in keys
+    )
+
+
+def bump_generation(*scope):
+    key = generation_key(*scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        current(key)
+
+
+def bump(*scopes):
+    def run():
+        for scope in scopes:
+            bump_generation(*scope)
+    run()
+    # Повторно после коммита: иначе параллельный запрос мог успеть
+    # закешировать старые данные под новым поколением.
+    transaction.on_commit(run)
+
+
+def remember_group(sender, instance, update_fields=None, **kwargs):
+    """Старая группа поста: пост пропадает и из её ленты."""
+    instance._old_group_id = None
+    if instance._state.adding or (update_fields is not None
+                                  and 'group' not in update_fields):
+        return
+    instance._old_group_id = sender.objects.using(
+        instance._state.db
+    ).filter(pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+def post_changed(sender, instance, **kwargs):
+    scopes = [('index',), ('author', instance.author_id),
+              ('post', instance.pk)]
+    groups = {instance.group_id, getattr(instance, '_old_group_id', None)}
+    scopes += [('group', group_id) for group_id in groups - {None}]
+    bump(*scopes)
+
+
+def comment_changed(sender, instance, **kwargs):
+    bump(('post', instance.post_id))
+
+
+def follow_changed(sender, instance, **kwargs):
+    bump(('follower', instance.user_id))
+
+
+def group_changed(sender, instance, **kwargs):
+    bump(())
+
+
+def remember_user(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or update_fields is not None:
+        return
+    instance._old_shown = sender.objects.filter(pk=instance.pk).values_list(
+        *SHOWN_USER_FIELDS
+    ).first()
+
+
+def user_changed(sender, instance, created=None, update_fields=None,
+                 **kwargs):
+    # Новый пользователь ещё нигде не показан.
+    if created:
+        return
+    # created=False — сохранение, None — удаление.
+    if created is False:
+        if update_fields is not None:
+            # Вход меняет только last_login.
+            if not set(update_fields) & set(SHOWN_USER_FIELDS):
+                return
+        elif getattr(instance, '_old_shown', None) == tuple(
+            getattr(instance, name) for name in SHOWN_USER_FIELDS
+        ):
+            return
+    bump(())
+
+
+def replicas_updated(sender, **kwargs):
+    # Промах кеша мог прочитать отстающую реплику: пересобираем записи.
+    bump_generation()
+
+
+def connect_signals():
+    pre_save.connect(remember_group, sender='posts.Post')
+    pre_save.connect(remember_user, sender=settings.AUTH_USER_MODEL)
+    for model, handler in (('posts.Post', post_changed),
+                           ('posts.Comment', comment_changed),
+                           ('posts.Follow', follow_changed),
+                           ('posts.Group', group_changed),
+                           (settings.AUTH_USER_MODEL, user_changed)):
+        post_save.connect(handler, sender=model)
+        post_delete.connect(handler, sender=model)
+    replicas_synced.connect(replicas_updated)
+
+
+def page_entries(page, key, generation):
+    """Записи страницы ленты; при промахе кеша читает page.object_list.
+
+    generation — version() областей, от которых зависит лента.
+    """
+    cache_key = f'feed:{generation}:{key}:{page.number}'
+    data = caching.get_or_set(
+        cache_key,
+        lambda: dumps(from_post(post) for post in page.object_list),
+        settings.FEED_CACHE_TIMEOUT,
+    )
+    return loads(data)
@@ -0,0 +1,85 @@
+"""Кеш поиска групп по slug и пользователей по username.
+
+Эти строки почти не меняются, а ищутся в начале каждого запроса к ленте
+группы или профилю. В кеше лежат значения нескольких полей: из них
+собирается экземпляр с отложенными остальными полями, так что хеш пароля
+в кеш не попадает, а save() не затрёт незагруженные поля. Несуществующие
+значения тоже кешируются, но ненадолго, чтобы перебор адресов ботами не
+стоил запроса к БД каждый раз.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.http import Http404
+
+from .models import Group, User
+
+# Порядок как у полей модели: так значения ожидает Model.from_db().
+FIELDS = {
+    Group: ('id', 'title', 'slug', 'description'),
+    User: ('id', 'username', 'first_name', 'last_name'),
+}
+LOOKUP_FIELDS = {Group: 'slug', User: 'username'}
+MISSING = ()
+
+
+def cache_key(model, value):
+    # Значение пришло из URL и может содержать что угодно.
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return f'lookup:{model._meta.label_lower}:{digest}'
+
+
+def get_or_404(model, value):
+    """Аналог get_object_or_404(model, <поле>=value) через кеш."""
+    key = cache_key(model, value)
+    values = cache.get(key)
+    if values is None:
+        field = LOOKUP_FIELDS[model]
+        values = model.objects.filter(**{field: value}).values_list(
+            *FIELDS[model]
+        ).first() or MISSING
+        cache.set(key, values, settings.LOOKUP_CACHE_TIMEOUT
+                  if values else settings.LOOKUP_NEGATIVE_TIMEOUT)
+    if not values:
+        raise Http404(f'{model._meta.object_name} не найден.')
+    return model.from_db('default', FIELDS[model], values)
+
+
+def forget(model, value):
+    key = cache_key(model, value)
+    cache.delete(key)
+    # Повторно после коммита: параллельный запрос мог успеть прочитать
+    # старую строку и снова положить её в кеш.
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def forget_old_value(sender, instance, update_fields=None, **kwargs):
+    """Старое значение поля поиска тоже нужно сбросить при переименовании."""
+    field = LOOKUP_FIELDS[sender]
+    if instance.pk is None or (update_fields is not None
+                               and field not in update_fields):
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        field, flat=True
+    ).first()
+    if old is not None and old != getattr(instance, field):
+        forget(sender, old)
+
+
+def forget_instance(sender, instance, update_fields=None, **kwargs):
+    field = LOOKUP_FIELDS[sender]
+    if update_fields is not None and not set(update_fields) & set(
+        FIELDS[sender]
+    ):
+        return
+    forget(sender, getattr(instance, field))
+
+
+def connect_signals():
+    for model in LOOKUP_FIELDS:
+        pre_save.connect(forget_old_value, sender=model)
+        post_save.connect(forget_instance, sender=model)
+        post_delete.connect(forget_instance, sender=model)
@@ -0,0 +1,47 @@
+import datetime as dt
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит старые посты с комментариями в годовые таблицы архива '
+        'пачками. Прерванный запуск можно просто повторить.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Архивировать посты старше стольких дней.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.ARCHIVE_CHUNK_SIZE
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пачками в секундах, чтобы не мешать записи '
+                 'живого трафика.'
+        )
+
+    def handle(self, *args, **options):
+        horizon = timezone.now() - dt.timedelta(days=options['days'])
+        total = 0
+        for alias in settings.POST_SHARDS:
+            last_id = 0
+            while True:
+                scanned, moved, last_id = archive.archive_chunk(
+                    alias, horizon, options['chunk_size'], last_id
+                )
+                if not scanned:
+                    break
+                total += moved
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{alias}: перенесено {moved}')
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено в архив постов: {total}.'
+        ))
@@ -0,0 +1,41 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка постов и комментариев автора в CSV/JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--format', choices=export.FORMATS, default='csv'
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--base-url', default='',
+            help='Префикс для ссылок на картинки, например https://yatube.ru'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        base_url = options['base_url'].rstrip('/')
+        rows = export.iter_rows(
+            author, lambda name: base_url + default_storage.url(name)
+        )
+        chunks = export.stream(rows, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,229 @@
+import bisect
+import datetime as dt
+import io
+import itertools
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from faker import Faker
+from PIL import Image
+from posts import bulk
+from posts.models import Comment, Follow, Group, Post, User
+
+IMAGE_COUNT = 8
+IMAGE_SIZE = (960, 339)
+MEAN_BURST = 5
+MEAN_GAP_MINUTES = 15
+SPAN_DAYS = 365
+END_DATE = dt.datetime(2022, 4, 1, tzinfo=dt.timezone.utc)
+
+
+def zipf_weights(count, alpha):
+    """Накопленные веса степенного распределения для rng.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** alpha for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетические данные заданного объёма '
+        'для нагрузочных замеров. Результат детерминирован при равном --seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=5000)
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.05,
+            help='Доля постов с картинкой.'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности авторов.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prefix', default='user')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.alpha = options['alpha']
+
+        users = self.create_users(options['users'], options['prefix'])
+        groups = self.create_groups(options['groups'])
+        images = self.create_images(options['image_ratio'])
+        posts = self.create_posts(
+            options['posts'], users, groups, images, options['image_ratio']
+        )
+        self.create_comments(options['comments'], users, posts)
+        self.create_follows(options['follows'], users)
+        bulk.finalize()
+        if options['verbosity']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+                f'постов {len(posts)}, комментариев {options["comments"]}, '
+                f'подписок до {options["follows"]}.'
+            ))
+
+    def insert(self, model, objects):
+        for chunk in bulk.chunked(objects, self.batch_size):
+            with transaction.atomic():
+                bulk.bulk_create(model, chunk)
+
+    def create_users(self, count, prefix):
+        password = make_password(None)
+        self.insert(User, (
+            User(
+                username=f'{prefix}{i}',
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password=password,
+            )
+            for i in range(count)
+        ))
+        ids = dict(
+            User.objects.filter(username__startswith=prefix)
+            .values_list('username', 'id')
+        )
+        return [ids[f'{prefix}{i}'] for i in range(count)]
+
+    def create_groups(self, count):
+        self.insert(Group, (
+            Group(
+                slug=f'group-{i}',
+                title=self.fake.catch_phrase(),
+                description=self.fake.paragraph(),
+            )
+            for i in range(count)
+        ))
+        ids = dict(
+            Group.objects.filter(slug__startswith='group-')
+            .values_list('slug', 'id')
+        )
+        return [ids[f'group-{i}'] for i in range(count)]
+
+    def create_images(self, ratio):
+        if ratio <= 0:
+            return []
+        names = []
+        for i in range(IMAGE_COUNT):
+            name = f'posts/generated-{i}.jpg'
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'JPEG')
+                name = default_storage.save(
+                    name, ContentFile(buffer.getvalue())
+                )
+            names.append(name)
+        return names
+
+    def post_times(self, count):
+        """Всплески: автор публикует серию постов с короткими паузами."""
+        start = END_DATE - dt.timedelta(days=SPAN_DAYS)
+        produced = 0
+        while produced < count:
+            burst = min(
+                count - produced,
+                1 + int(self.rng.expovariate(1 / MEAN_BURST))
+            )
+            moment = start + dt.timedelta(
+                seconds=self.rng.uniform(0, SPAN_DAYS * 24 * 3600)
+            )
+            yield burst, moment
+            produced += burst
+
+    def create_posts(self, count, users, groups, images, image_ratio):
+        before = {
+            alias: Post.objects.using(alias).aggregate(
+                last=Max('id')
+            )['last'] or 0
+            for alias in settings.POST_SHARDS
+        }
+        author_weights = zipf_weights(len(users), self.alpha)
+        group_weights = zipf_weights(len(groups), self.alpha)
+
+        def generate():
+            for burst, moment in self.post_times(count):
+                author = self.rng.choices(users, cum_weights=author_weights)[0]
+                group = None
+                if groups and self.rng.random() < 0.6:
+                    group = self.rng.choices(
+                        groups, cum_weights=group_weights
+                    )[0]
+                for _ in range(burst):
+                    image = ''
+                    if images and self.rng.random() < image_ratio:
+                        image = self.rng.choice(images)
+                    yield Post(
+                        text=self.fake.text(),
+                        pub_date=moment,
+                        author_id=author,
+                        group_id=group,
+                        image=image,
+                    )
+                    moment += dt.timedelta(
+                        minutes=self.rng.expovariate(1 / MEAN_GAP_MINUTES)
+                    )
+
+        self.insert(Post, generate())
+        return sorted(
+            post
+            for alias, last in before.items()
+            for post in Post.objects.using(alias).filter(id__gt=last)
+            .values_list('id', 'pub_date')
+        )
+
+    def create_comments(self, count, users, posts):
+        if not posts:
+            return
+        post_weights = zipf_weights(len(posts), self.alpha)
+        order = list(range(len(posts)))
+        self.rng.shuffle(order)
+
+        def generate():
+            for _ in range(count):
+                rank = bisect.bisect_left(
+                    post_weights, self.rng.random() * post_weights[-1]
+                )
+                post_id, pub_date = posts[order[rank]]
+                yield Comment(
+                    post_id=post_id,
+                    author_id=self.rng.choice(users),
+                    text=self.fake.sentence(),
+                    created=pub_date + dt.timedelta(
+                        minutes=self.rng.expovariate(1 / 60)
+                    ),
+                )
+
+        self.insert(Comment, generate())
+
+    def create_follows(self, count, users):
+        if len(users) < 2:
+            return
+        author_weights = zipf_weights(len(users), self.alpha)
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            user = self.rng.choice(users)
+            author = self.rng.choices(users, cum_weights=author_weights)[0]
+            if user != author:
+                pairs.add((user, author))
+        self.insert(Follow, (
+            Follow(user_id=user, author_id=author)
+            for user, author in sorted(pairs)
+        ))
@@ -0,0 +1,54 @@
+import time
+
+from core import tasks
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts import deletion
+from posts.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет задания фонового удаления пользователей и постов '
+        'пачками. Прерванные и упавшие задания продолжаются с места '
+        'остановки. Задание, которое уже выполняет воркер run_tasks, '
+        'пропускается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.DELETION_CHUNK_SIZE
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пачками в секундах.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Проверять очередь каждые N секунд; 0 — один проход.'
+        )
+
+    def handle(self, *args, **options):
+        worker = f'{tasks.worker_name()}:process_deletions'
+        size, pause = options['chunk_size'], options['pause']
+        while True:
+            for job in DeletionJob.objects.unfinished():
+                # Та же задача очереди, что и у воркера: её аренда не
+                # даёт выполнить задание дважды одновременно.
+                deletion.enqueue(job)
+                claimed = tasks.claim(worker, 1, key=deletion.task_key(job))
+                if not claimed:
+                    self.stdout.write(f'{job}: выполняется или ждёт повтора')
+                    continue
+                result = tasks.execute(
+                    claimed[0],
+                    lambda task: deletion.process(job, size, pause),
+                )
+                job.refresh_from_db()
+                if result == 'done':
+                    self.stdout.write(f'{job}: удалено строк {job.deleted}')
+                else:
+                    self.stderr.write(f'{job}: {job.error}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
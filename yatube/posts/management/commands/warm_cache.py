@@ -0,0 +1,119 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from posts.models import Group, Post, User
+from posts.views import NUMBER_OF_POST
+
+
+class TokenBucket:
+    """Не больше rate запросов в секунду на все потоки вместе."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    1.0, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def page_urls(url, posts, pages):
+    count = min(pages, max(1, math.ceil(posts / NUMBER_OF_POST)))
+    return [url if page == 1 else f'{url}?page={page}'
+            for page in range(1, count + 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает общий кеш: первые страницы главной, всех групп и '
+        'профилей с наибольшим числом подписчиков. Имеет смысл с общим '
+        'бэкендом кеша (Memcached, Redis), а не с LocMemCache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=3,
+            help='Сколько первых страниц каждой ленты прогревать.'
+        )
+        parser.add_argument(
+            '--profiles', type=int, default=50,
+            help='Сколько самых популярных профилей прогревать.'
+        )
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--rate', type=float, default=10,
+            help='Запросов в секунду на все потоки, чтобы не мешать '
+                 'живому трафику.'
+        )
+        parser.add_argument('--host', default='localhost')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        urls = page_urls(
+            reverse('posts:index'), Post.objects.count(), pages
+        )
+        groups = Group.objects.annotate(total=Count('posts'))
+        for group in groups:
+            urls += page_urls(
+                reverse('posts:group_list', args=[group.slug]),
+                group.total, pages,
+            )
+        authors = User.objects.annotate(
+            followers=Count('following', distinct=True),
+            total=Count('posts', distinct=True),
+        ).order_by('-followers')[:options['profiles']]
+        for author in authors:
+            urls += page_urls(
+                reverse('posts:profile', args=[author.username]),
+                author.total, pages,
+            )
+
+        bucket = TokenBucket(options['rate'])
+        local = threading.local()
+        host = options['host']
+
+        def warm(url):
+            bucket.take()
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_HOST=host)
+            started = time.monotonic()
+            try:
+                response = local.client.get(url)
+            finally:
+                # Соединения с БД у каждого потока свои, и тестовый
+                # клиент сам их не закрывает.
+                connections.close_all()
+            return url, response.status_code, time.monotonic() - started
+
+        started = time.monotonic()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for url, status, duration in pool.map(warm, urls):
+                if status != 200:
+                    failed += 1
+                    self.stderr.write(f'{url}: {status}')
+                elif options['verbosity'] > 1:
+                    self.stdout.write(f'{url}: {duration * 1000:.0f} мс')
+        self.stdout.write(self.style.SUCCESS(
+            f'Прогрето страниц: {len(urls) - failed} из {len(urls)} '
+            f'за {time.monotonic() - started:.1f} с.'
+        ))
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_shard_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivePartition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveSmallIntegerField(unique=True, verbose_name='Год')),
+                ('first_id', models.PositiveIntegerField(null=True)),
+                ('last_id', models.PositiveIntegerField(null=True)),
+            ],
+            options={
+                'ordering': ['-period'],
+            },
+        ),
+    ]
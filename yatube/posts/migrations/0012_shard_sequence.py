@@ -0,0 +1,87 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:22
+
+import importlib
+
+from django.db import migrations, models
+
+search_index = importlib.import_module('posts.migrations.0011_post_search')
+
+
+class ConstrainOnDefault(migrations.operations.base.Operation):
+    """Возвращает ограничения внешних ключей только в основной базе.
+
+    В модели связи с пользователями и группами без ограничений
+    (db_constraint=False), потому что в остальных шардах этих таблиц нет.
+    В основной базе таблицы есть, и ограничения там нужны. Состояние
+    моделей не меняется.
+    """
+    reversible = True
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def alter(self, app_label, schema_editor, state, db_constraint):
+        for model_name, name in self.fields:
+            model_state = state.models[app_label, model_name]
+            field = dict(model_state.fields)[name].clone()
+            field.db_constraint = db_constraint
+            operation = migrations.AlterField(model_name, name, field)
+            new_state = state.clone()
+            operation.state_forwards(app_label, new_state)
+            if schema_editor is not None:
+                operation.database_forwards(
+                    app_label, schema_editor, state, new_state
+                )
+            state = new_state
+        return state
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.alias == 'default':
+            self.alter(app_label, schema_editor, from_state, True)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.alias == 'default':
+            constrained = self.alter(app_label, None, to_state, True)
+            self.alter(app_label, schema_editor, constrained, False)
+
+    def describe(self):
+        return 'Restore foreign key constraints on the default database'
+
+
+def create_search_triggers(apps, schema_editor):
+    # SQLite пересоздаёт posts_post при AlterField и теряет триггеры.
+    tables = schema_editor.connection.introspection.table_names()
+    if 'posts_post_fts' in tables:
+        search_index.create_search_triggers(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, unique=True)),
+                ('last', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(
+            migrations.RunPython.noop, create_search_triggers
+        ),
+        ConstrainOnDefault([
+            ('comment', 'author'), ('post', 'author'), ('post', 'group'),
+        ]),
+        migrations.RunPython(
+            create_search_triggers, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:29
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    follows = Follow.objects.using(schema_editor.connection.alias)
+    first = follows.values('user', 'author').annotate(
+        first=Min('id')
+    ).values_list('first', flat=True)
+    follows.exclude(pk__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_shard_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
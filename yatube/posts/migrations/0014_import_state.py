@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_unique_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('rows', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import models
 
 User = get_user_model()
 
 
+def is_detached(alias):
+    """В базе alias нет пользователей и групп: шард постов или архив."""
+    return alias != 'default' and (
+        alias in settings.POST_SHARDS or alias == settings.ARCHIVE_DATABASE
+    )
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -13,20 +22,68 @@ class Group(models.Model):
         return self.title
 
 
+class ShardedQuerySet(models.QuerySet):
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False,
+                    raw=False):
+        """raw=True пишет поля как есть, как loaddata: даты auto_now_add
+        берутся из объектов (импорт и генерация данных, posts.bulk)."""
+        self._raw_insert = raw
+        return super().bulk_create(objs, batch_size, ignore_conflicts)
+
+    def _insert(self, objs, fields, return_id=False, raw=False, using=None,
+                ignore_conflicts=False):
+        return super()._insert(
+            objs, fields, return_id=return_id,
+            raw=raw or getattr(self, '_raw_insert', False), using=using,
+            ignore_conflicts=ignore_conflicts,
+        )
+
+    def create(self, **kwargs):
+        """Без .using() базу выбирает роутер по самой записи.
+
+        QuerySet.create() спрашивает роутер без экземпляра, и
+        posts.sharding не может выбрать шард.
+        """
+        instance = self.model(**kwargs)
+        self._for_write = True
+        instance.save(force_insert=True, using=self._db)
+        return instance
+
+
+class PostQuerySet(ShardedQuerySet):
+    def with_related(self):
+        """Подтягивает автора и группу одним запросом."""
+        if is_detached(self.db):
+            return self.prefetch_related('author', 'group')
+        return self.select_related('author', 'group')
+
+    def visible(self):
+        """Без постов, которые ждут фонового удаления (posts.deletion)."""
+        authors, posts = DeletionJob.objects.hidden()
+        queryset = self
+        if authors:
+            queryset = queryset.exclude(author_id__in=authors)
+        if posts:
+            queryset = queryset.exclude(pk__in=posts)
+        return queryset
+
+
 class Post(models.Model):
     text = models.TextField()
-    pub_date = models.DateTimeField(auto_now_add=True)
+    pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='posts'
+        related_name='posts',
+        db_constraint=False,
     )
     group = models.ForeignKey(
         Group,
         blank=True,
         null=True,
         on_delete=models.SET_NULL,
-        related_name='posts'
+        related_name='posts',
+        db_constraint=False,
     )
     image = models.ImageField(
         'Картинка',
@@ -34,6 +91,8 @@ class Post(models.Model):
         blank=True
     )
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:15]
 
@@ -51,10 +110,13 @@ class Comment(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_constraint=False,
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -73,3 +135,106 @@ class Follow(models.Model):
         null=True,
         verbose_name='Имя автора',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
+
+
+class ShardSequence(models.Model):
+    """Счётчик id модели в шарде (posts.sharding): строка лежит в той же
+    базе, что и таблица, и увеличивается одним UPDATE."""
+    model = models.CharField(max_length=100, unique=True)
+    last = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.model}: {self.last}'
+
+
+class ImportState(models.Model):
+    """Сколько строк файла уже импортировала команда import_data.
+
+    Пишется в одной транзакции с пачкой, поэтому --resume продолжает ровно
+    с первой незакоммиченной строки.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    rows = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.source}: {self.rows}'
+
+
+class ArchivePartition(models.Model):
+    """Годовая таблица архива постов (posts.archive)."""
+    period = models.PositiveSmallIntegerField('Год', unique=True)
+    first_id = models.PositiveIntegerField(null=True)
+    last_id = models.PositiveIntegerField(null=True)
+
+    def __str__(self):
+        return str(self.period)
+
+    class Meta:
+        ordering = ['-period']
+
+
+class DeletionJobQuerySet(models.QuerySet):
+    HIDDEN_KEY = 'deletion:hidden'
+
+    def unfinished(self):
+        return self.exclude(status=DeletionJob.DONE)
+
+    def hidden(self):
+        """(id авторов, id постов) незавершённых заданий, через кеш."""
+        value = cache.get(self.HIDDEN_KEY)
+        if value is None:
+            jobs = self.unfinished()
+            value = tuple(
+                frozenset(jobs.filter(kind=kind).values_list(
+                    'object_id', flat=True
+                ))
+                for kind in (DeletionJob.USER, DeletionJob.POST)
+            )
+            cache.set(self.HIDDEN_KEY, value, None)
+        return value
+
+    def forget_hidden(self):
+        cache.delete(self.HIDDEN_KEY)
+
+
+class DeletionJob(models.Model):
+    """Фоновое удаление пользователя или поста (posts.deletion)."""
+    USER = 'user'
+    POST = 'post'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    kind = models.CharField(
+        'Что удаляется',
+        max_length=4,
+        choices=[(USER, 'Пользователь'), (POST, 'Пост')],
+    )
+    object_id = models.PositiveIntegerField('id')
+    status = models.CharField(
+        'Состояние',
+        max_length=7,
+        choices=[(PENDING, 'В очереди'), (RUNNING, 'Выполняется'),
+                 (DONE, 'Готово'), (FAILED, 'Ошибка')],
+        default=PENDING,
+    )
+    deleted = models.PositiveIntegerField('Удалено строк', default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    objects = DeletionJobQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.object_id}'
+
+    class Meta:
+        ordering = ['created']
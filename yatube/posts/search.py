@@ -0,0 +1,43 @@
+"""Индексный поиск постов по тексту.
+
+В SQLite текст постов продублирован в полнотекстовом индексе FTS5
+posts_post_fts, который поддерживают триггеры (миграция 0011). Поиск
+идёт по началам слов, а не по подстроке, зато без полного просмотра
+таблицы. В других СУБД и в шардах постов, где индекса нет, остаётся
+icontains.
+"""
+import functools
+
+from django.db import connections
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def fts_query(term):
+    # Каждое слово в кавычках: символы синтаксиса FTS5 ищутся как есть.
+    words = term.replace('"', '""').split()
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+@functools.lru_cache(maxsize=None)
+def has_index(alias):
+    """Есть ли индекс в базе alias; таблицу создают миграции, поэтому
+    список таблиц читается один раз на базу, а не на каждый поиск."""
+    connection = connections[alias]
+    return (connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names())
+
+
+def search(queryset, term):
+    if not term.split():
+        return queryset
+    if not has_index(queryset.db):
+        return queryset.filter(text__icontains=term)
+    # Не pk__in=RawSQL(...): Django обернёт подзапрос во вторые скобки,
+    # и SQLite вернёт из него только первую строку.
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[fts_query(term)],
+    )
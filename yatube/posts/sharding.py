@@ -0,0 +1,230 @@
+"""Посты и комментарии по нескольким базам (шардам).
+
+Шард поста — POST_SHARDS[author_id % N], комментарий лежит в шарде своего
+поста. id поста выбирается так, что id % N равен номеру шарда, поэтому
+post_detail находит шард по одному id; номера выдаёт счётчик
+ShardSequence в базе шарда. Пользователи, группы и подписки
+остаются в основной базе: в остальных шардах связи с ними не проверяются
+на уровне БД (db_constraint=False, миграция 0012 возвращает ограничения
+только в основной базе), а select_related заменяется prefetch_related.
+Ленты по всем шардам собираются k-way слиянием по (pub_date, id),
+шарды опрашиваются параллельно; потоки пула закрывают свои соединения
+после каждого запроса, как это делает конец запроса в основном потоке.
+
+С одним шардом (по умолчанию) всё работает как с обычной базой.
+"""
+import heapq
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Max
+from django.db.models.signals import pre_save
+
+from .models import Comment, Post, ShardSequence, is_detached
+
+SHARDED_MODELS = (Post, Comment)
+ORDERING = ('-pub_date', '-id')
+
+_pool = None
+
+
+def count():
+    return len(settings.POST_SHARDS)
+
+
+def is_sharded():
+    return count() > 1
+
+
+def shard_for_author(author_id):
+    return settings.POST_SHARDS[author_id % count()]
+
+
+def shard_for_post(post_id):
+    return settings.POST_SHARDS[int(post_id) % count()]
+
+
+def comments_of(post):
+    comments = post.comments.all()
+    if is_detached(post._state.db):
+        return comments.prefetch_related('author')
+    return comments.select_related('author')
+
+
+def posts_of(author):
+    return Post.objects.using(shard_for_author(author.pk)).filter(
+        author_id=author.pk
+    )
+
+
+def post_queryset(post_id):
+    """Queryset шарда, где лежит пост с этим id."""
+    return Post.objects.using(shard_for_post(post_id))
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=count(), thread_name_prefix='yatube-shards'
+        )
+    return _pool
+
+
+def on_shards(func):
+    """[func(alias) для каждого шарда], шарды опрашиваются параллельно."""
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            # Конец запроса закрывает только соединения своего потока.
+            connections[alias].close_if_unusable_or_obsolete()
+    return list(pool().map(run, settings.POST_SHARDS))
+
+
+def sort_key(post):
+    return (post.pub_date, post.pk)
+
+
+class ShardedFeed:
+    """Лента по всем шардам, которую понимает Paginator.
+
+    Для страницы [start:stop] из каждого шарда берутся первые stop постов,
+    поэтому дальние страницы дороже ближних.
+    """
+
+    ordered = True
+
+    def __init__(self, **filters):
+        self.filters = filters
+
+    def queryset(self, alias):
+        return Post.objects.using(alias).filter(
+            **self.filters
+        ).visible().order_by(*ORDERING).with_related()
+
+    def count(self):
+        return sum(on_shards(lambda alias: self.queryset(alias).count()))
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        stop = index.stop
+        parts = on_shards(lambda alias: list(self.queryset(alias)[:stop]))
+        merged = heapq.merge(*parts, key=sort_key, reverse=True)
+        return list(merged)[index]
+
+
+def feed(**filters):
+    """Queryset для одного шарда, ShardedFeed — для нескольких."""
+    if not is_sharded():
+        return Post.objects.filter(**filters).visible().with_related()
+    return ShardedFeed(**filters)
+
+
+def followed_feed(user):
+    if not is_sharded():
+        return feed(author__following__user=user)
+    # Подписки лежат в основной базе, JOIN с ними в шарде невозможен.
+    authors = list(user.follower.values_list('author_id', flat=True))
+    return ShardedFeed(author_id__in=authors)
+
+
+def allocate(model, alias, number=1):
+    """Первый из number новых id модели в шарде alias, следующие — через N.
+
+    Счётчик увеличивается одним UPDATE в базе шарда: строка (в SQLite —
+    вся база) заблокирована до коммита, поэтому параллельные процессы и
+    поток записи core.writes получают разные id.
+    """
+    index = settings.POST_SHARDS.index(alias)
+    label = model._meta.label_lower
+    sequences = ShardSequence.objects.using(alias).filter(model=label)
+    with transaction.atomic(using=alias):
+        if not sequences.update(last=F('last') + number):
+            # Первый id в шарде: продолжаем после уже занятых.
+            taken = model.objects.using(alias).aggregate(Max('id'))
+            start = (taken['id__max'] or 0) // count()
+            try:
+                with transaction.atomic(using=alias):
+                    ShardSequence.objects.using(alias).create(
+                        model=label, last=start + number
+                    )
+            except IntegrityError:
+                sequences.update(last=F('last') + number)
+        last = sequences.values_list('last', flat=True).get()
+    return (last - number + 1) * count() + index
+
+
+def allocate_id(sender, instance, using, **kwargs):
+    if instance.pk is None and is_sharded():
+        instance.pk = allocate(sender, using)
+
+
+def bulk_create(model, objects, **kwargs):
+    """bulk_create, раскладывающий посты и комментарии по шардам."""
+    if not is_sharded() or model not in SHARDED_MODELS:
+        return model.objects.bulk_create(objects, **kwargs)
+    router = PostShardRouter()
+    by_shard = defaultdict(list)
+    for instance in objects:
+        by_shard[router.db_for_write(model, instance=instance)].append(
+            instance
+        )
+    for alias, instances in by_shard.items():
+        new = [instance for instance in instances if instance.pk is None]
+        if new:
+            pk = allocate(model, alias, len(new))
+            for instance in new:
+                instance.pk, pk = pk, pk + count()
+        model.objects.using(alias).bulk_create(instances, **kwargs)
+    return objects
+
+
+def connect_signals():
+    for model in SHARDED_MODELS:
+        pre_save.connect(allocate_id, sender=model)
+
+
+class PostShardRouter:
+    """Пишет посты и комментарии в шард автора поста."""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if model in SHARDED_MODELS and isinstance(instance, SHARDED_MODELS):
+            # Несохранённый комментарий (проверка формы) ищет пост там,
+            # куда будет записан.
+            if (isinstance(instance, Comment) and instance._state.db is None
+                    and instance.post_id is not None):
+                return shard_for_post(instance.post_id)
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if isinstance(instance, Post):
+            return shard_for_author(instance.author_id)
+        if isinstance(instance, Comment):
+            return shard_for_post(instance.post_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if isinstance(obj1, SHARDED_MODELS) or isinstance(
+            obj2, SHARDED_MODELS
+        ):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in settings.POST_SHARDS:
+            return None
+        # Журнал изменений пишется в базу изменения (core.outbox).
+        return (app_label, model_name) in (
+            ('posts', 'post'), ('posts', 'comment'),
+            ('posts', 'shardsequence'), ('core', 'outboxevent')
+        )
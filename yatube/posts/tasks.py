@@ -0,0 +1,28 @@
+"""Фоновые задачи постов (core.tasks)."""
+from core.tasks import task
+from django.core.files.storage import default_storage
+from sorl import thumbnail
+
+from . import feed
+from .models import DeletionJob
+
+
+@task(priority=-10)
+def make_thumbnail(name):
+    """Создаёт превью для лент заранее, а не при первом показе."""
+    # Пост могли удалить раньше, чем дошла очередь.
+    if default_storage.exists(name):
+        feed.thumbnail_url(name)
+
+
+@task
+def delete_image(name):
+    # Вместе с превью из хранилища ключей sorl-thumbnail.
+    thumbnail.delete(name)
+
+
+@task(priority=10)
+def process_deletion(job_id):
+    # posts.deletion сам ставит эту задачу, поэтому импорт здесь.
+    from .deletion import process
+    process(DeletionJob.objects.get(pk=job_id))
@@ -0,0 +1,200 @@
+import datetime as dt
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase, TransactionTestCase
+from posts import bulk, feed
+from posts.management.commands.generate_data import END_DATE, SPAN_DAYS
+from posts.models import (Comment, Follow, Group, ImportState, Post,
+                          User)
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for name in ('author', 'reader', 'third'):
+            User.objects.create(username=name)
+
+    def write(self, name, records):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            for record in records:
+                target.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def import_data(self, kind, path, *args):
+        stderr = StringIO()
+        call_command(
+            'import_data', kind, path, *args, '--no-finalize',
+            stdout=StringIO(), stderr=stderr
+        )
+        return stderr.getvalue()
+
+    def test_dates_kept_and_missing_posts_reported(self):
+        """Даты берутся из файла, комментарии к чужим id пропускаются."""
+        path = self.write('posts.jsonl', [{
+            'id': 7, 'author': 'author', 'text': 'Старый пост',
+            'pub_date': '2020-05-01T12:00:00+00:00',
+        }])
+        self.import_data('posts', path)
+        post = Post.objects.get(pk=7)
+        self.assertEqual(
+            post.pub_date, dt.datetime(2020, 5, 1, 12, tzinfo=dt.timezone.utc)
+        )
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+
+        path = self.write('comments.jsonl', [
+            {'post': 7, 'author': 'reader', 'text': 'Есть пост',
+             'created': '2020-05-02T12:00:00+00:00'},
+            {'post': 8, 'author': 'reader', 'text': 'Нет поста'},
+        ])
+        errors = self.import_data('comments', path)
+        self.assertIn('Строка 2: пост 8 не найден', errors)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.text, 'Есть пост')
+        self.assertEqual(comment.created.day, 2)
+
+    def test_resume_does_not_duplicate_follows(self):
+        """Повтор с сохранённой строки не задваивает подписки."""
+        path = self.write('follows.jsonl', [
+            {'user': 'reader', 'author': 'author'},
+            {'user': 'third', 'author': 'author'},
+            {'user': 'reader', 'author': 'third'},
+        ])
+        self.import_data('follows', path, '--batch-size', '2')
+        self.assertEqual(ImportState.objects.get(source=path).rows, 3)
+        ImportState.objects.filter(source=path).update(rows=1)
+        self.import_data('follows', path, '--resume')
+        self.assertEqual(Follow.objects.count(), 3)
+
+        Follow.objects.all().delete()
+        ImportState.objects.filter(source=path).update(rows=2)
+        self.import_data('follows', path, '--resume')
+        self.assertEqual(
+            list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+            [('reader', 'third')],
+        )
+
+    def test_resume_after_failed_batch(self):
+        """Состояние коммитится с пачкой: после сбоя комментарии без
+        уникального ключа не загружаются второй раз."""
+        post = Post.objects.create(
+            author=User.objects.get(username='author'), text='Пост'
+        )
+        path = self.write('comments.jsonl', [
+            {'post': post.pk, 'author': 'reader', 'text': f'Комментарий {n}'}
+            for n in range(3)
+        ])
+        bulk_create = bulk.bulk_create
+        calls = []
+
+        def fail_second(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise OSError('Сбой')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(bulk, 'bulk_create', fail_second):
+            with self.assertRaises(OSError):
+                self.import_data('comments', path, '--batch-size', '2')
+        self.assertEqual(ImportState.objects.get(source=path).rows, 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.import_data('comments', path, '--resume')
+        self.assertEqual(
+            sorted(Comment.objects.values_list('text', flat=True)),
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'],
+        )
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, **options):
+        call_command(
+            'generate_data', users=20, groups=4, posts=300, comments=200,
+            follows=50, image_ratio=0, seed=7, verbosity=0, **options
+        )
+
+    def test_counts(self):
+        """Создаётся ровно заказанное число строк, подписки не задваиваются."""
+        self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        self.assertLessEqual(len(follows), 50)
+        self.assertEqual(len(set(follows)), len(follows))
+        self.assertFalse(Follow.objects.filter(user_id=F('author_id')))
+
+    def test_distribution(self):
+        """Популярность авторов степенная, даты — в годе до END_DATE."""
+        self.generate()
+        per_author = Counter(dict(
+            User.objects.annotate(total=Count('posts'))
+            .values_list('username', 'total')
+        ))
+        top = sum(total for _, total in per_author.most_common(5))
+        self.assertGreater(top, Post.objects.count() / 2)
+        self.assertGreater(per_author['user0'], per_author['user19'])
+
+        start = END_DATE - dt.timedelta(days=SPAN_DAYS)
+        self.assertFalse(Post.objects.filter(pub_date__lt=start))
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date'))
+        )
+
+    def test_seed_repeats_data(self):
+        """Тот же --seed даёт те же данные."""
+        self.generate()
+        first = list(Post.objects.order_by('pub_date', 'text').values_list(
+            'text', 'pub_date', 'author__username'
+        ))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        cache.clear()
+        self.generate()
+        second = list(Post.objects.order_by('pub_date', 'text').values_list(
+            'text', 'pub_date', 'author__username'
+        ))
+        self.assertEqual(first, second)
+
+
+class WarmCacheTests(TransactionTestCase):
+    """Потоки прогрева читают базу своими соединениями: данные должны
+    быть закоммичены."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Post.objects.create(author=self.author, group=self.group, text='Пост')
+
+    def test_first_pages_cached(self):
+        """После прогрева первые страницы лент читаются из кеша."""
+        stdout = StringIO()
+        call_command(
+            'warm_cache', pages=1, workers=2, rate=1000, stdout=stdout
+        )
+        self.assertIn('Прогрето страниц: 3 из 3', stdout.getvalue())
+        for key, scope in (
+            ('index', ('index',)),
+            (f'group:{self.group.pk}', ('group', self.group.pk)),
+            (f'profile:{self.author.pk}', ('author', self.author.pk)),
+        ):
+            with self.subTest(key=key):
+                self.assertIsNotNone(
+                    cache.get(f'feed:{feed.version(scope)}:{key}:1')
+                )
@@ -1,5 +1,14 @@
-from django.test import TestCase
-from posts.models import Group, Post, User
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from posts import export, sharding
+from posts.models import Comment, Group, Post, ShardSequence, User
 
 NUMBER_OF_SIMBOL = 16
 NUMBER_OF_SIMBOL_STR = 15
@@ -31,3 +40,168 @@ class PostModelTest(TestCase):
         for expect, model in test_models_expect.items():
             with self.subTest(field=expect):
                 self.assertEqual(str(model), expect)
+
+
+@override_settings(POST_SHARDS=['default', 'shard1', 'shard2'])
+class ShardingTest(TestCase):
+    def test_post_id_encodes_shard(self):
+        """id нового поста указывает на шард его автора."""
+        user = User.objects.create_user(username='auth')
+        Post.objects.using('default').create(author=user, text='Пост')
+        post_id = sharding.allocate(Post, 'default')
+        self.assertEqual(sharding.shard_for_post(post_id), 'default')
+        self.assertEqual(sharding.shard_for_author(4), 'shard1')
+        self.assertEqual(sharding.shard_for_post(post_id + 2), 'shard2')
+
+    def test_allocate_reserves_block(self):
+        """Пачка id берётся одним UPDATE счётчика и не пересекается."""
+        first = sharding.allocate(Post, 'default', 5)
+        second = sharding.allocate(Post, 'default')
+        self.assertEqual(first % 3, 0)
+        self.assertEqual(second, first + 5 * 3)
+        self.assertEqual(
+            ShardSequence.objects.get(model='posts.post').last, 6
+        )
+
+
+SHARD = 'posts_shard1'
+
+
+class RealShardsTest(TransactionTestCase):
+    """Два настоящих шарда: основная база и отдельный файл SQLite."""
+    databases = {'default', SHARD}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.mkdtemp()
+        connections.databases[SHARD] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(cls.shard_dir, 'shard.sqlite3'),
+        }
+        connections.ensure_defaults(SHARD)
+        connections.prepare_test_settings(SHARD)
+        cls.shards = override_settings(POST_SHARDS=['default', SHARD])
+        cls.shards.enable()
+        call_command('migrate', database=SHARD, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.shards.disable()
+        connections[SHARD].close()
+        del connections[SHARD]
+        del connections.databases[SHARD]
+        shutil.rmtree(cls.shard_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        first = User.objects.create_user(username='first')
+        second = User.objects.create_user(username='second')
+        # Шард автора — POST_SHARDS[id % 2].
+        self.local, self.remote = sorted(
+            (first, second), key=lambda user: user.pk % 2
+        )
+        self.local_post = Post.objects.create(
+            author=self.local, text='Пост в основной базе'
+        )
+        self.remote_post = Post.objects.create(
+            author=self.remote, text='Пост во втором шарде'
+        )
+
+    def test_posts_written_to_author_shard(self):
+        """Пост лежит в шарде автора, а его id указывает на этот шард."""
+        self.assertEqual(self.remote_post._state.db, SHARD)
+        self.assertEqual(self.remote_post.pk % 2, 1)
+        self.assertEqual(self.local_post.pk % 2, 0)
+        self.assertFalse(
+            Post.objects.using('default').filter(
+                author=self.remote
+            ).exists()
+        )
+        more = sharding.bulk_create(Post, [
+            Post(author=self.remote, text=f'Пост {number}')
+            for number in range(3)
+        ])
+        self.assertEqual({post.pk % 2 for post in more}, {1})
+        self.assertEqual(
+            Post.objects.using(SHARD).filter(author=self.remote).count(), 4
+        )
+
+    def test_pages_read_both_shards(self):
+        """Главная, пост и экспорт находят посты обоих шардов."""
+        comment = Comment.objects.create(
+            post=self.remote_post, author=self.local, text='Комментарий'
+        )
+        self.assertEqual(comment._state.db, SHARD)
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.remote_post.pk, self.local_post.pk],
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.remote_post.pk])
+        )
+        self.assertContains(response, 'Комментарий')
+        rows = list(export.iter_rows(self.local))
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [('post', self.local_post.pk), ('comment', comment.pk)],
+        )
+
+    def test_api_reads_both_shards(self):
+        """API листает ленту по обоим шардам и находит пост во втором."""
+        Comment.objects.create(
+            post=self.remote_post, author=self.local, text='Комментарий'
+        )
+        response = self.client.get(
+            reverse('api:index'), {'limit': 1, 'fields': 'id,author'}
+        )
+        data = response.json()
+        self.assertEqual(data['results'], [{
+            'id': self.remote_post.pk,
+            'author': {'username': self.remote.username, 'full_name': ''},
+        }])
+        data = self.client.get(data['next']).json()
+        self.assertEqual(
+            [post['id'] for post in data['results']], [self.local_post.pk]
+        )
+        data = self.client.get(
+            reverse('api:post_detail', args=[self.remote_post.pk])
+        ).json()
+        self.assertEqual(data['comments'][0]['text'], 'Комментарий')
+
+    def test_user_delete_cleans_other_shards(self):
+        """delete() пользователя удаляет его строки и в другом шарде."""
+        Comment.objects.create(
+            post=self.remote_post, author=self.local, text='Комментарий'
+        )
+        self.remote.delete()
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        self.assertFalse(Comment.objects.using(SHARD).exists())
+        self.assertTrue(Post.objects.filter(pk=self.local_post.pk).exists())
+
+    def test_admin_edits_post_in_shard(self):
+        """Админка показывает шард и сохраняет пост туда же."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'shard': SHARD}
+        )
+        self.assertContains(response, 'Пост во втором шарде')
+        self.assertNotContains(response, 'Пост в основной базе')
+        url = reverse('admin:posts_post_change', args=[self.remote_post.pk])
+        response = self.client.post(url, {
+            'text': 'Исправленный пост',
+            'author': self.remote.pk,
+            'group': '',
+            'pub_date_0': '2022-01-01',
+            'pub_date_1': '00:00:00',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Post.objects.using(SHARD).get(pk=self.remote_post.pk).text,
+            'Исправленный пост',
+        )
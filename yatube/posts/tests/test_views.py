@@ -1,13 +1,34 @@
+import datetime as dt
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+from unittest import mock
+
 from django import forms
+from core import tasks
+from core.models import OutboxEvent
+from django.conf import settings
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.core.paginator import Paginator
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post, User
+from django.utils import timezone
+from posts import archive, deletion, feed, search
+from posts.admin import PostAdmin
+from posts.models import (Comment, DeletionJob, Follow, Group, Post,
+                          User)
 
 NUMBER_OF_POST = 10
 NUMBER_OF_POST_2 = 3
 NUMBER_OF_TEST_POST = 13
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class TaskPagesTests(TestCase):
@@ -66,7 +87,7 @@ class TaskPagesTests(TestCase):
     def test_index_page_show_correct_context(self):
         """Шаблон index сформирован с правильным контекстом."""
         response = self.guest_client.get(reverse('posts:index'))
-        context = response.context['page_obj'].object_list
+        context = list(response.context['page_obj'].object_list)
         paginator = Paginator(
             Post.objects.order_by('-pub_date'), NUMBER_OF_POST
         )
@@ -78,7 +99,7 @@ class TaskPagesTests(TestCase):
         response = self.authorized_client.get(
             reverse('posts:group_list', kwargs={'slug': 'the_group'})
         )
-        context = response.context['page_obj'].object_list
+        context = list(response.context['page_obj'].object_list)
         paginator = Paginator(
             Post.objects.order_by('-pub_date'), NUMBER_OF_POST
         )
@@ -90,7 +111,7 @@ class TaskPagesTests(TestCase):
         response = self.authorized_client.get(
             reverse('posts:profile', kwargs={'username': 'test_user'})
         )
-        context = response.context['page_obj'].object_list
+        context = list(response.context['page_obj'].object_list)
         paginator = Paginator(
             Post.objects.order_by('-pub_date'), NUMBER_OF_POST
         )
@@ -321,3 +342,517 @@ class CacheTests(TestCase):
             reverse('posts:index')
         ).content
         self.assertNotEqual(response, response_non_cache)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        cls.user2 = User.objects.create(username='test_user2')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(
+            author=cls.user, post=cls.post, text='Тестовый комментарий'
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.authorized_client2 = Client()
+        self.authorized_client2.force_login(self.user2)
+
+    def test_export_csv_and_jsonl(self):
+        """Выгрузка содержит посты и комментарии автора."""
+        url = reverse('posts:profile_export', args=[self.user.username])
+        response = self.authorized_client.get(url)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Тестовый пост', content)
+        self.assertIn('Тестовый комментарий', content)
+        response = self.authorized_client.get(url, {'format': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_export_forbidden_for_other_users(self):
+        """Чужую выгрузку получить нельзя."""
+        response = self.authorized_client2.get(
+            reverse('posts:profile_export', args=[self.user.username])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+    def test_export_skips_posts_pending_deletion(self):
+        """Удаляемые посты и комментарии к ним не выгружаются."""
+        cache.clear()
+        post = Post.objects.create(author=self.user, text='Удаляемый пост')
+        Comment.objects.create(
+            author=self.user, post=post, text='Ответ на удаляемый'
+        )
+        deletion.schedule_post(post)
+        response = self.authorized_client.get(
+            reverse('posts:profile_export', args=[self.user.username])
+        )
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Тестовый пост', content)
+        self.assertNotIn('Удаляемый пост', content)
+        self.assertNotIn('Ответ на удаляемый', content)
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cached_page_needs_no_post_queries(self):
+        """Закешированная страница ленты выводится без запроса постов."""
+        self.guest_client.get(reverse('posts:profile', args=['test_user']))
+        # Остаётся только подсчёт постов для пагинатора.
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(
+                reverse('posts:profile', args=['test_user'])
+            )
+        self.assertContains(response, 'Тестовый пост')
+
+    def test_new_post_resets_feed(self):
+        """Новый пост сразу попадает в ленту."""
+        self.guest_client.get(reverse('posts:profile', args=['test_user']))
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.guest_client.get(
+            reverse('posts:profile', args=['test_user'])
+        )
+        self.assertContains(response, 'Свежий пост')
+
+    def test_index_fragment_follows_generation(self):
+        """Удалённый пост сразу пропадает из закешированной главной."""
+        post = Post.objects.create(author=self.user, text='Удаляемый пост')
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Удаляемый пост')
+        post.delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Удаляемый пост')
+
+    def test_changes_reset_only_their_feeds(self):
+        """Комментарий, подписка и вход не сбрасывают чужие ленты."""
+        reader = User.objects.create(username='reader')
+        group = Group.objects.create(title='Группа', slug='group')
+        other = Group.objects.create(title='Другая', slug='other')
+        post = Post.objects.create(author=self.user, text='Пост', group=group)
+
+        def versions():
+            return {
+                'index': feed.version(('index',)),
+                'group': feed.version(('group', group.pk)),
+                'other': feed.version(('group', other.pk)),
+                'profile': feed.version(('author', self.user.pk)),
+                'post': feed.version(('post', post.pk)),
+                'follow': feed.version(
+                    ('index',), ('follower', reader.pk)
+                ),
+            }
+
+        def changed(action):
+            before = versions()
+            action()
+            after = versions()
+            return {name for name in before if before[name] != after[name]}
+
+        self.assertEqual(changed(lambda: Comment.objects.create(
+            post=post, author=reader, text='Комментарий'
+        )), {'post'})
+        self.assertEqual(changed(lambda: Follow.objects.create(
+            user=reader, author=self.user
+        )), {'follow'})
+        self.assertEqual(changed(
+            lambda: reader.save(update_fields=['last_login'])
+        ), set())
+        self.assertEqual(changed(reader.save), set())
+
+        def move():
+            post.group = other
+            post.save()
+        self.assertEqual(
+            changed(move),
+            {'index', 'group', 'other', 'profile', 'post', 'follow'},
+        )
+        reader.first_name = 'Читатель'
+        self.assertEqual(changed(reader.save), set(versions()))
+
+
+class DonutCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        cls.user2 = User.objects.create(username='test_user2')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.authorized_client2 = Client()
+        self.authorized_client2.force_login(self.user2)
+
+    def test_personal_parts_not_shared(self):
+        """Общий кеш страницы не отдаёт чужие кнопки и форму."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'редактировать запись')
+        response = self.authorized_client2.get(url)
+        self.assertNotContains(response, 'редактировать запись')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        response = Client().get(url)
+        self.assertContains(response, 'Тестовый пост')
+        self.assertNotContains(response, 'Добавить комментарий')
+
+    def test_follow_button_per_user(self):
+        """Кнопка подписки зависит от пользователя, а не от кеша."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        url = reverse('posts:profile', args=[self.user.username])
+        self.assertContains(self.authorized_client2.get(url), 'Отписаться')
+        self.assertContains(Client().get(url), 'Подписаться')
+
+
+class LookupCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_unknown_username_cached(self):
+        """Повторный запрос несуществующего профиля не идёт в БД."""
+        url = reverse('posts:profile', args=['nobody'])
+        self.assertEqual(
+            self.guest_client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+        with self.assertNumQueries(0):
+            self.guest_client.get(url)
+        User.objects.create(username='nobody')
+        self.assertEqual(self.guest_client.get(url).status_code, HTTPStatus.OK)
+
+    def test_renamed_user_forgotten(self):
+        """После смены username старый адрес профиля перестаёт работать."""
+        url = reverse('posts:profile', args=['test_user'])
+        self.guest_client.get(url)
+        self.user.username = 'renamed_user'
+        self.user.save()
+        self.assertEqual(
+            self.guest_client.get(url).status_code, HTTPStatus.NOT_FOUND
+        )
+
+
+class ArchiveTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.user = User.objects.create(username='test_user')
+        self.old_post = Post.objects.create(
+            author=self.user, text='Старый пост'
+        )
+        Post.objects.filter(pk=self.old_post.pk).update(
+            pub_date=dt.datetime(2020, 5, 1, tzinfo=dt.timezone.utc)
+        )
+        self.old_comment = Comment.objects.create(
+            post=self.old_post, author=self.user, text='Старый комментарий'
+        )
+        Post.objects.create(author=self.user, text='Новый пост')
+        call_command('archive_posts', stdout=StringIO())
+
+    def tearDown(self):
+        # Таблицы архива не описаны в миграциях, и flush их не очищает.
+        for model in archive.partition_models(2020):
+            model.objects.all().delete()
+
+    def test_old_posts_leave_hot_table(self):
+        """Старые посты уходят из горячей таблицы и с главной."""
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Старый пост')
+
+    def test_archived_post_resolved(self):
+        """Архивный пост открывается по прежнему адресу и есть в профиле."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.old_post.pk])
+        )
+        self.assertContains(response, 'Старый комментарий')
+        self.assertTrue(response.context['post'].is_archived)
+        response = self.guest_client.get(
+            reverse('posts:profile', args=['test_user'])
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Новый пост', 'Старый пост'],
+        )
+
+    def test_rerun_moves_nothing(self):
+        """Повторный запуск ничего не переносит и не дублирует."""
+        call_command('archive_posts', stdout=StringIO())
+        response = self.guest_client.get(
+            reverse('posts:profile', args=['test_user'])
+        )
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+
+    def test_moved_rows_recorded(self):
+        """Перенос пишет в журнал удаление из горячих таблиц."""
+        self.assertEqual(
+            list(OutboxEvent.objects.filter(
+                action=OutboxEvent.DELETE
+            ).values_list('model', 'object_id', 'payload')),
+            [('posts.comment', self.old_comment.pk, '{}'),
+             ('posts.post', self.old_post.pk, '{"group_id": null}')],
+        )
+
+    def test_late_comment_not_lost(self):
+        """Комментарий, добавленный во время переноса, не теряется."""
+        post = Post.objects.create(author=self.user, text='Ещё старый')
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=dt.datetime(2020, 6, 1, tzinfo=dt.timezone.utc)
+        )
+        Comment.objects.create(post=post, author=self.user, text='Ранний')
+
+        def comment_after_copy(key):
+            Comment.objects.create(
+                post=post, author=self.user, text='Поздний'
+            )
+
+        late_cache = mock.Mock(wraps=cache)
+        late_cache.delete.side_effect = comment_after_copy
+        with mock.patch.object(archive, 'cache', late_cache):
+            scanned, moved, _ = archive.archive_chunk(
+                'default', timezone.now() - dt.timedelta(days=365), 10
+            )
+        self.assertEqual((scanned, moved), (1, 0))
+        self.assertEqual(
+            sorted(post.comments.values_list('text', flat=True)),
+            ['Поздний', 'Ранний'],
+        )
+        call_command('archive_posts', stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        comment_model = archive.partition_models(2020)[1]
+        self.assertEqual(
+            comment_model.objects.filter(post_id=post.pk).count(), 2
+        )
+
+    def test_late_chunk_does_not_stop_shard(self):
+        """Пачка, целиком оставшаяся из-за поздних комментариев, не
+        останавливает перенос следующих."""
+        posts = []
+        for day in (1, 2):
+            post = Post.objects.create(author=self.user, text=f'Пост {day}')
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=dt.datetime(2020, 7, day, tzinfo=dt.timezone.utc)
+            )
+            posts.append(post)
+        first, second = posts
+
+        def comment_after_copy(key):
+            if not first.comments.exists():
+                Comment.objects.create(
+                    post=first, author=self.user, text='Поздний'
+                )
+
+        late_cache = mock.Mock(wraps=cache)
+        late_cache.delete.side_effect = comment_after_copy
+        with mock.patch.object(archive, 'cache', late_cache):
+            call_command(
+                'archive_posts', '--chunk-size', '1', stdout=StringIO()
+            )
+        self.assertTrue(Post.objects.filter(pk=first.pk).exists())
+        self.assertFalse(Post.objects.filter(pk=second.pk).exists())
+        call_command('archive_posts', stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=first.pk).exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DeletionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='test_user')
+        cls.other = User.objects.create(username='other_user')
+        cls.image = default_storage.save('posts/deleted.gif', ContentFile(
+            b'GIF89a\x01\x00\x01\x00\x00\x00\x00;'
+        ))
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, text=f'Удаляемый пост {number}',
+                image=cls.image if number == 0 else '',
+            )
+            for number in range(3)
+        ]
+        cls.other_post = Post.objects.create(
+            author=cls.other, text='Чужой пост'
+        )
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.other, text='Комментарий'
+        )
+        Comment.objects.create(
+            post=cls.other_post, author=cls.user, text='Ответ'
+        )
+        Follow.objects.create(user=cls.other, author=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_scheduled_user_hidden(self):
+        """Удаляемый пользователь сразу пропадает из лент и профиля."""
+        deletion.schedule_user(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.other_post]
+        )
+        response = self.guest_client.get(
+            reverse('posts:profile', args=['test_user'])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_user_deleted_in_chunks(self):
+        """Задание удаляет всё, что связано с пользователем, и картинки."""
+        job = deletion.schedule_user(self.user)
+        with self.settings(DELETION_CHUNK_SIZE=1):
+            tasks.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        # Подписка, два комментария и три поста.
+        self.assertEqual(job.deleted, 6)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Post.objects.all()), [self.other_post])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(default_storage.exists(self.image))
+
+    def test_post_deleted(self):
+        """Удаление поста убирает его вместе с комментариями."""
+        deletion.schedule_post(self.posts[0])
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.posts[0].pk])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        call_command('process_deletions', stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=self.posts[0].pk).exists())
+        self.assertEqual(Comment.objects.get().text, 'Ответ')
+
+    def test_command_skips_claimed_job(self):
+        """Команда не выполняет задание, которое забрал воркер."""
+        deletion.schedule_post(self.posts[0])
+        tasks.claim('worker', 1)
+        out = StringIO()
+        call_command('process_deletions', stdout=out)
+        self.assertIn('выполняется', out.getvalue())
+        self.assertTrue(Post.objects.filter(pk=self.posts[0].pk).exists())
+
+
+class PostAdminTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {number}', slug=f'group-{number}',
+                description='Описание',
+            )
+            for number in range(3)
+        ]
+        cls.url = reverse('admin:posts_post_changelist')
+
+    def setUp(self):
+        cache.clear()
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+
+    def create_posts(self, number, text='Пост в админке'):
+        return [
+            Post.objects.create(
+                author=self.admin, text=text, group=self.groups[0]
+            )
+            for _ in range(number)
+        ]
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin_client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк."""
+        self.create_posts(NUMBER_OF_POST_2)
+        self.count_queries()
+        few = self.count_queries()
+        self.create_posts(NUMBER_OF_POST - NUMBER_OF_POST_2)
+        self.assertEqual(self.count_queries(), few)
+
+    def test_search_uses_index(self):
+        """Поиск находит посты по началу слова."""
+        self.create_posts(NUMBER_OF_POST_2, text='Полнотекстовый поиск')
+        other = self.create_posts(1, text='Другой текст')[0]
+        response = self.admin_client.get(self.url, {'q': 'полнотекст'})
+        self.assertEqual(len(response.context['cl'].result_list),
+                         NUMBER_OF_POST_2)
+        self.assertNotIn(other, response.context['cl'].result_list)
+
+    def test_search_checks_index_once(self):
+        """Наличие индекса не проверяется заново при каждом поиске."""
+        search.search(Post.objects.all(), 'поиск')
+        with self.assertNumQueries(0):
+            search.search(Post.objects.all(), 'поиск')
+
+    def test_move_to_group(self):
+        """Действие переносит посты одним UPDATE и пишет журнал."""
+        posts = self.create_posts(NUMBER_OF_POST_2)
+        OutboxEvent.objects.all().delete()
+        response = self.admin_client.post(self.url, {
+            'action': 'move_to_group',
+            'group': self.groups[1].pk,
+            '_selected_action': [post.pk for post in posts[:2]],
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(
+            Post.objects.filter(group=self.groups[1]).count(), 2
+        )
+        self.assertEqual(
+            sorted(OutboxEvent.objects.filter(
+                model='posts.post', action=OutboxEvent.UPDATE
+            ).values_list('object_id', flat=True)),
+            sorted(post.pk for post in posts[:2]),
+        )
+
+    def test_keyset_navigation(self):
+        """Ссылка «Следующие» открывает посты старше последнего на
+        странице."""
+        posts = self.create_posts(NUMBER_OF_POST_2)
+        with mock.patch.object(PostAdmin, 'list_per_page', 2):
+            response = self.admin_client.get(self.url)
+            self.assertEqual(response.context['keyset_next'],
+                             f'?before={posts[1].pk}')
+            response = self.admin_client.get(
+                self.url, {'before': posts[1].pk}
+            )
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [posts[0]])
+        self.assertNotIn('keyset_next', response.context)
@@ -1,47 +1,77 @@
+from core import writes
+from core.db_routers import use_primary
+from core.paginator import EstimatedCountPaginator
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import archive, export, feed, lookups, sharding
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import DeletionJob, Follow, Group, User
 
 NUMBER_OF_POST = 10
 
 
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, NUMBER_OF_POST)
+    post_list = sharding.feed()
+    paginator = EstimatedCountPaginator(
+        post_list, NUMBER_OF_POST, count_key='index'
+    )
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    generation = feed.version(('index',))
     context = {
         'page_obj': page_obj,
+        'entries': feed.page_entries(page_obj, 'index', generation),
+        'generation': generation,
+        'cache_timeout': settings.INDEX_CACHE_TIMEOUT,
     }
     return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, NUMBER_OF_POST)
+    group = lookups.get_or_404(Group, slug)
+    post_list = sharding.feed(group_id=group.pk)
+    paginator = EstimatedCountPaginator(
+        post_list, NUMBER_OF_POST, count_key=f'group:{group.pk}'
+    )
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    generation = feed.version(('group', group.pk))
     context = {
         'page_obj': page_obj,
+        'entries': feed.page_entries(
+            page_obj, f'group:{group.pk}', generation
+        ),
+        'generation': generation,
         'group': group,
     }
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post = author.posts.all()
-    paginator = Paginator(post, NUMBER_OF_POST)
+    author = lookups.get_or_404(User, username)
+    hidden_authors, _ = DeletionJob.objects.hidden()
+    if author.pk in hidden_authors:
+        raise Http404('Пользователь удаляется.')
+    post = archive.posts_of(author)
+    paginator = EstimatedCountPaginator(
+        post, NUMBER_OF_POST, count_key=f'profile:{author.pk}'
+    )
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists())
+    generation = feed.version(('author', author.pk))
     context = {
         'page_obj': page_obj,
+        'entries': feed.page_entries(
+            page_obj, f'profile:{author.pk}', generation
+        ),
+        'generation': generation,
         'author': author,
         'following': following,
     }
@@ -49,10 +79,16 @@ def profile(request, username):
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = sharding.post_queryset(post_id).with_related().filter(
+        pk=post_id
+    ).first() or archive.get_post(post_id)
+    hidden_authors, hidden_posts = DeletionJob.objects.hidden()
+    if (post is None or post.pk in hidden_posts
+            or post.author_id in hidden_authors):
+        raise Http404('Пост не найден.')
     group = post.group
     form = CommentForm()
-    comments = post.comments.all()
+    comments = sharding.comments_of(post)
     author = post.author
     context = {
         'post': post,
@@ -60,6 +96,9 @@ def post_detail(request, post_id):
         "group": group,
         "form": form,
         "comments": comments,
+        # Вызывается шаблоном, только если фрагмент не в кеше.
+        'author_posts_count': archive.posts_of(author).count,
+        'generation': feed.version(('post', post.pk), ('author', author.pk)),
     }
     return render(request, 'posts/post_detail.html', context)
 
@@ -70,14 +109,15 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        writes.run(post.save)
         return redirect("posts:profile", request.user.username)
     return render(request, "posts/post_create.html", {"form": form})
 
 
 @login_required
+@use_primary
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(sharding.post_queryset(post_id), id=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -99,38 +139,72 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(sharding.post_queryset(post_id), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        writes.run(comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, NUMBER_OF_POST)
+    post_list = sharding.followed_feed(request.user)
+    paginator = EstimatedCountPaginator(post_list, NUMBER_OF_POST)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    # Лента зависит от любых постов и от подписок пользователя.
+    generation = feed.version(('index',), ('follower', request.user.pk))
     context = {
         'page_obj': page_obj,
+        'entries': feed.page_entries(
+            page_obj, f'follow:{request.user.pk}', generation
+        ),
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = lookups.get_or_404(User, username)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        writes.run(
+            Follow.objects.get_or_create, user=request.user, author=author
+        )
     return redirect("posts:profile", username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    author = lookups.get_or_404(User, username)
+    writes.run(
+        Follow.objects.filter(user=request.user, author=author).delete
+    )
     return redirect("posts:profile", username=username)
+
+
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    hidden_authors, _ = DeletionJob.objects.hidden()
+    if author.pk in hidden_authors:
+        raise Http404('Пользователь удаляется.')
+    if author != request.user and not request.user.is_staff:
+        raise PermissionDenied
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in export.FORMATS:
+        raise Http404
+    rows = export.iter_rows(
+        author,
+        lambda name: request.build_absolute_uri(default_storage.url(name))
+    )
+    response = StreamingHttpResponse(
+        export.stream(rows, export_format),
+        content_type=export.CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{export_format}"'
+    )
+    return response
@@ -0,0 +1,23 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+from posts import deletion
+
+User = get_user_model()
+
+
+class BackgroundDeletionUserAdmin(UserAdmin):
+    actions = ('delete_in_background',)
+
+    def delete_in_background(self, request, queryset):
+        for user in queryset:
+            deletion.schedule_user(user)
+        self.message_user(
+            request,
+            'Пользователи деактивированы и поставлены в очередь на удаление.'
+        )
+    delete_in_background.short_description = 'Удалить в фоне'
+
+
+admin.site.unregister(User)
+admin.site.register(User, BackgroundDeletionUserAdmin)
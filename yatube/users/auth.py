@@ -0,0 +1,87 @@
+"""Определение пользователя запроса через общий кеш.
+
+Вместе с сессиями cached_db запрос залогиненного пользователя не
+обращается к БД ради сессии и auth_user. В кеше лежат несколько полей
+пользователя и хеш для проверки сессии (HMAC от пароля, а не сам пароль).
+Остальные поля у экземпляра отложены и подгружаются при обращении.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.crypto import constant_time_compare
+
+User = auth.get_user_model()
+
+# Порядок как у полей модели: так значения ожидает Model.from_db().
+FIELDS = ('id', 'is_superuser', 'username', 'first_name', 'last_name',
+          'email', 'is_staff', 'is_active')
+
+
+def cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def load(user_id, backend_path):
+    key = cache_key(user_id)
+    record = cache.get(key)
+    if record is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return None
+        record = (
+            tuple(getattr(user, field) for field in FIELDS),
+            user.get_session_auth_hash(),
+        )
+        cache.set(key, record, settings.AUTH_USER_CACHE_TIMEOUT)
+    return record
+
+
+def get_user(request):
+    """Как django.contrib.auth.get_user, но без запроса к auth_user."""
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    record = load(user_id, backend_path)
+    if record is None:
+        return AnonymousUser()
+    values, session_auth_hash = record
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash
+            and constant_time_compare(session_hash, session_auth_hash)):
+        request.session.flush()
+        return AnonymousUser()
+    user = User.from_db('default', FIELDS, values)
+    user.backend = backend_path
+    return user
+
+
+def forget(user_id):
+    key = cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def forget_user(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login, которого в кеше нет.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    forget(instance.pk)
+
+
+def forget_logged_out(sender, user, **kwargs):
+    if user is not None:
+        forget(user.pk)
+
+
+def connect_signals():
+    post_save.connect(forget_user, sender=User)
+    post_delete.connect(forget_user, sender=User)
+    user_logged_out.connect(forget_logged_out)
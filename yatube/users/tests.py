@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+User = get_user_model()
+
+
+class CachedAuthenticationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='test_user', password='old-password-123'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.login(
+            username='test_user', password='old-password-123'
+        )
+
+    def test_no_queries_for_identity(self):
+        """Повторный запрос залогиненного пользователя не идёт в БД."""
+        url = reverse('about:author')
+        self.authorized_client.get(url)
+        with self.assertNumQueries(0):
+            response = self.authorized_client.get(url)
+        self.assertContains(response, 'test_user')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """После смены пароля другие сессии пользователя недействительны."""
+        other_client = Client()
+        other_client.login(username='test_user', password='old-password-123')
+        other_client.get(reverse('about:author'))
+        response = self.authorized_client.post(
+            reverse('users:password_change'), {
+                'old_password': 'old-password-123',
+                'new_password1': 'new-password-456',
+                'new_password2': 'new-password-456',
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        response = self.authorized_client.get(reverse('posts:post_create'))
+        self.assertEqual(response.status_code, 200)
+        response = other_client.get(reverse('posts:post_create'))
+        self.assertRedirects(
+            response, reverse('users:login') + '?next='
+            + reverse('posts:post_create')
+        )
+
+    def test_logout_and_edit_reset_cache(self):
+        """Выход и изменение пользователя сбрасывают запись в кеше."""
+        self.authorized_client.get(reverse('about:author'))
+        self.user.first_name = 'Имя'
+        self.user.save()
+        self.assertIsNone(cache.get(f'auth:user:{self.user.pk}'))
+        self.authorized_client.get(reverse('about:author'))
+        self.authorized_client.get(reverse('users:logout'))
+        self.assertIsNone(cache.get(f'auth:user:{self.user.pk}'))
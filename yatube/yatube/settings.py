@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'core.apps.CoreConfig',
     'users.apps.UsersConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -50,13 +52,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestStatsMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilerMiddleware',
+    'core.middleware.TracingMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.WriteTimeoutMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -66,7 +74,7 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.backends.templates.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -94,6 +102,75 @@ DATABASES = {
     }
 }
 
+# Мелкие записи (комментарии, подписки, посты) коммитятся пачками одним
+# потоком процесса (core.writes).
+WRITE_COORDINATOR = True
+WRITE_BATCH_SIZE = 64
+WRITE_TIMEOUT = 10
+
+# Реплики только для чтения (core.db_routers). Для SQLite это снимки
+# основной базы, которые обновляет команда sync_replicas.
+READ_REPLICAS = []
+for number in range(int(os.environ.get('YATUBE_READ_REPLICAS', 0))):
+    alias = f'replica{number + 1}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    READ_REPLICAS.append(alias)
+
+# Посты и комментарии по шардам (posts.sharding). Первый шард — основная
+# база; дополнительные шарды добавляет YATUBE_POST_SHARDS=N, их схему
+# создаёт migrate --database=posts_shardK.
+POST_SHARDS = ['default']
+for number in range(1, int(os.environ.get('YATUBE_POST_SHARDS', 1))):
+    alias = f'posts_shard{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    POST_SHARDS.append(alias)
+
+# Посты старше ARCHIVE_AFTER_DAYS команда archive_posts переносит в годовые
+# таблицы архива (posts.archive). YATUBE_ARCHIVE_DB=1 выносит архив в
+# отдельную базу.
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_CHUNK_SIZE = 500
+ARCHIVE_DATABASE = 'default'
+if os.environ.get('YATUBE_ARCHIVE_DB'):
+    ARCHIVE_DATABASE = 'posts_archive'
+    DATABASES[ARCHIVE_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.{ARCHIVE_DATABASE}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Очередь фоновых задач в основной базе (core.tasks, команда run_tasks).
+TASK_LEASE_SECONDS = 5 * 60
+TASK_RETRY_DELAY = 10
+TASK_POLL_INTERVAL = 1
+
+# Журнал изменений для потребителей (core.outbox, команда consume_outbox).
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_POLL_INTERVAL = 1
+
+# Размер пачки фонового удаления пользователей и постов (posts.deletion).
+DELETION_CHUNK_SIZE = 500
+
+DATABASE_ROUTERS = [
+    'core.db_routers.WriteTrackingRouter',
+    'posts.archive.ArchiveRouter',
+    'posts.sharding.PostShardRouter',
+    'core.db_routers.ReadReplicaRouter',
+]
+
+# Сколько секунд после запроса с записью пользователь читает из основной
+# базы.
+REPLICA_STICKY_COOKIE = 'use_primary'
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,8 +221,123 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.backends.cache.LocMemCache',
     }
 }
 
+# Двухуровневый кеш (core.caching): размер и срок жизни LRU в памяти
+# процесса и срок блокировки, под которой значение пересчитывается.
+TIERED_CACHE_LOCAL_SIZE = 1000
+TIERED_CACHE_LOCAL_TIMEOUT = 5
+TIERED_CACHE_LOCK_TIMEOUT = 10
+
+# Записи лент (posts.feed) сбрасываются сигналами, срок — страховка.
+FEED_CACHE_TIMEOUT = 5 * 60
+# Фрагмент главной и страницы лент API: меняются чаще всего, поэтому
+# живут меньше.
+INDEX_CACHE_TIMEOUT = 20
+FEED_EXCERPT_LENGTH = 1000
+
+# Пагинация больших лент и списков админки по оценке числа объектов
+# (core.paginator); меньшие объёмы считаются точно.
+ESTIMATED_COUNT_THRESHOLD = 1000
+ESTIMATED_COUNT_TIMEOUT = 10 * 60
+
+# Поиск групп и авторов по slug и username (posts.lookups); отсутствующие
+# значения кешируются коротко.
+LOOKUP_CACHE_TIMEOUT = 60 * 60
+LOOKUP_NEGATIVE_TIMEOUT = 60
+
+# Сессии и пользователь запроса читаются из кеша (users.auth).
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
+THUMBNAIL_BACKEND = 'core.backends.thumbnails.ThumbnailBackend'
+
+# Доля запросов, для которых RequestStatsMiddleware собирает статистику.
+REQUEST_STATS_SAMPLE_RATE = 0.1
+
+# Файлы, которые пишет работающий сайт (журналы, метрики, профили), лежат
+# вне исходников: в YATUBE_RUN_DIR или во временном каталоге системы.
+RUN_DIR = os.environ.get(
+    'YATUBE_RUN_DIR', os.path.join(tempfile.gettempdir(), 'yatube')
+)
+
+# Каталог mmap-файлов prometheus_client: метрики всех воркеров
+# суммируются при отдаче /metrics. Мастер gunicorn очищает его при старте
+# (gunicorn.conf.py), а каждый процесс при старте удаляет файлы
+# завершившихся (core.metrics.clear_dead).
+METRICS_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(RUN_DIR, 'metrics')
+)
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+# /metrics отдаётся адресам INTERNAL_IPS (не через прокси), по заголовку
+# Authorization: Bearer <YATUBE_METRICS_TOKEN> и сотрудникам.
+INTERNAL_IPS = ['127.0.0.1', '::1']
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
+# Профили отдельных запросов (см. core.middleware.ProfilerMiddleware).
+PROFILER_DIR = os.path.join(RUN_DIR, 'profiles')
+PROFILER_INTERVAL = 0.005
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+
+# Доля запросов, которые трассируются в LOGS_DIR/traces.jsonl.
+TRACING_SAMPLE_RATE = 0.01
+
+LOGS_DIR = os.environ.get('YATUBE_LOGS_DIR', os.path.join(RUN_DIR, 'logs'))
+os.makedirs(LOGS_DIR, exist_ok=True)
+
+# Запросы дольше порога попадают в LOGS_DIR/slow_queries.jsonl; 0
+# выключает.
+SLOW_QUERY_THRESHOLD_MS = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(LOGS_DIR, 'requests.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        },
+        'traces': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(LOGS_DIR, 'traces.jsonl'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(LOGS_DIR, 'slow_queries.jsonl'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.traces': {
+            'handlers': ['traces'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'